@@ -0,0 +1,451 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from db import read_connection
+from resultcache import cached
+from sla import record_first_responses, record_resolutions
+from schema import ARCHIVE_TABLE
+from topics import get_topic_index
+
+
+def _resolution_hours(raised_on, closed_on):
+    # Same truncation as TIMESTAMPDIFF(HOUR, ...)
+    return int((closed_on - raised_on).total_seconds() // 3600)
+
+
+def _bump_daily(cursor, deltas):
+    rows = [(day, priority, status, delta) for (day, priority, status), delta in deltas.items() if delta]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO ticket_daily_rollup (day, priority, status, ticket_count)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE ticket_count = ticket_count + VALUES(ticket_count)
+        """, rows)
+
+
+def _bump_resolution(cursor, deltas):
+    rows = [(priority, hours, delta) for (priority, hours), delta in deltas.items() if delta]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO ticket_resolution_rollup (priority, resolution_hours, ticket_count)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE ticket_count = ticket_count + VALUES(ticket_count)
+        """, rows)
+
+
+# Call inside the transaction that inserted the ticket
+def record_ticket_created(cursor, raised_on, priority, status):
+    _bump_daily(cursor, {(raised_on.date(), priority, status): 1})
+
+
+# Change the status of several tickets with one UPDATE and keep the rollups
+# and SLA sketches in step, inside the caller's transaction.
+# ticket_closed_on is only stamped when tickets are closed. `responded`
+# says an agent made the change, so moving a ticket out of open counts as
+# its first response; a customer closing their own ticket does not.
+# Tickets already in new_status are left alone, and so, when from_status
+# is given, are tickets no longer in it: the status is re-checked under the
+# row lock, not taken from what the caller last read. Returns the number
+# of tickets changed.
+def change_ticket_statuses(cursor, ticket_ids, new_status, responded=False, from_status=None):
+    ticket_ids = list(dict.fromkeys(ticket_ids))
+    if not ticket_ids:
+        return 0
+    placeholders = ", ".join(["%s"] * len(ticket_ids))
+    only_from = "AND status = %s" if from_status is not None else ""
+    cursor.execute(f"""
+        SELECT ticket_id, priority, status, ticket_raised_on, ticket_closed_on
+        FROM support_ticket
+        WHERE ticket_id IN ({placeholders}) AND status <> %s {only_from}
+        FOR UPDATE
+    """, (*ticket_ids, new_status, *([from_status] if from_status is not None else [])))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    if isinstance(rows[0], dict):
+        rows = [(r["ticket_id"], r["priority"], r["status"], r["ticket_raised_on"], r["ticket_closed_on"])
+                for r in rows]
+
+    closing = new_status.lower() == "closed"
+    now = datetime.now()
+    # Second precision, as stored, so a reopen removes the same sample
+    closed_on = now.replace(microsecond=0) if closing else None
+    found = [row[0] for row in rows]
+    placeholders = ", ".join(["%s"] * len(found))
+    cursor.execute(f"""
+        UPDATE support_ticket
+        SET status = %s, ticket_closed_on = %s, status_changed_on = %s
+        WHERE ticket_id IN ({placeholders}) AND status <> %s
+    """, (new_status, closed_on, now, *found, new_status))
+
+    if responded and new_status.lower() != "open":
+        record_first_responses(cursor, found, now.replace(microsecond=0))
+
+    daily = Counter()
+    resolution = Counter()
+    sla_changes = []
+    for _, priority, old_status, raised_on, old_closed_on in rows:
+        daily[(raised_on.date(), priority, old_status)] -= 1
+        daily[(raised_on.date(), priority, new_status)] += 1
+        if old_status.lower() == "closed" and old_closed_on is not None:
+            resolution[(priority, _resolution_hours(raised_on, old_closed_on))] -= 1
+        if closing:
+            resolution[(priority, _resolution_hours(raised_on, closed_on))] += 1
+        was_closed = old_status.lower() == "closed" and old_closed_on is not None
+        sla_changes.append((priority, raised_on, old_closed_on if was_closed else None, closed_on))
+    _bump_daily(cursor, daily)
+    _bump_resolution(cursor, resolution)
+    record_resolutions(cursor, sla_changes)
+    return len(found)
+
+
+def change_ticket_status(cursor, ticket_id, new_status, responded=False, from_status=None):
+    return change_ticket_statuses(cursor, [ticket_id], new_status, responded, from_status) > 0
+
+
+# Frames querylog looks past when naming the caller of a statement
+__querylog_skip__ = {"_fetch", "_frame"}
+
+
+def _fetch(cursor, query, params=()):
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def _frame(query, params=(), columns=None):
+    with read_connection() as conn:
+        rows = _fetch(conn.cursor(dictionary=True), query, params)
+    return pd.DataFrame(rows, columns=columns)
+
+
+PRIORITY_STATUS_SQL = """
+    SELECT priority, status, SUM(ticket_count) AS Count
+    FROM ticket_daily_rollup
+    GROUP BY priority, status
+    HAVING SUM(ticket_count) > 0
+"""
+
+RESOLUTION_SQL = """
+    SELECT resolution_hours, SUM(ticket_count) AS Count
+    FROM ticket_resolution_rollup
+    GROUP BY resolution_hours
+    HAVING SUM(ticket_count) > 0
+    ORDER BY resolution_hours
+"""
+
+# The user/status view shows this many customers by ticket count and folds
+# the rest into one "Other" row per status, so its size does not grow with
+# the number of customers
+TOP_USERS = 10
+OTHER = "Other"
+
+# Ticket counts per status for the top `limit` customers, plus OTHER, and
+# how many customers have tickets at all. Grouping by customer_id first
+# keeps the work to a handful of rows per customer and only the top names
+# are joined in. Archived tickets count too.
+USER_STATUS_TOP_SQL = f"""
+    WITH s AS (
+        SELECT customer_id, status, COUNT(*) AS ticket_count
+        FROM support_ticket
+        GROUP BY customer_id, status
+        UNION ALL
+        SELECT customer_id, status, COUNT(*) AS ticket_count
+        FROM {ARCHIVE_TABLE}
+        GROUP BY customer_id, status
+    ), r AS (
+        SELECT customer_id, ROW_NUMBER() OVER (ORDER BY SUM(ticket_count) DESC, customer_id) AS rank_no,
+               COUNT(*) OVER () AS customers
+        FROM s
+        GROUP BY customer_id
+    )
+    SELECT COALESCE(u.name, '{OTHER}') AS name, s.status, SUM(s.ticket_count) AS Count,
+           MAX(r.customers) AS customers
+    FROM s
+    JOIN r ON r.customer_id = s.customer_id
+    LEFT JOIN customer_profile c ON c.customer_id = s.customer_id AND r.rank_no <= %s
+    LEFT JOIN user_login u ON c.user_id = u.user_id
+    GROUP BY COALESCE(u.name, '{OTHER}'), s.status
+"""
+
+# Time series are read from the daily rollup in the finest of these periods
+# that keeps them within MAX_POINTS points: (name, days, SQL expression)
+VOLUME_PERIODS = [
+    ("Day", 1, "day"),
+    ("Week", 7, "day - INTERVAL WEEKDAY(day) DAY"),
+    ("Month", 31, "MAKEDATE(YEAR(day), 1) + INTERVAL (MONTH(day) - 1) MONTH"),
+    ("Year", 366, "MAKEDATE(YEAR(day), 1)"),
+]
+MAX_POINTS = 120
+
+
+# Ticket counts per priority and status, from the daily rollup
+def get_priority_status_counts():
+    df = _frame(PRIORITY_STATUS_SQL, columns=["priority", "status", "Count"])
+    df["Count"] = df["Count"].astype(int)
+    return df
+
+
+# Closed-ticket counts per whole resolution hour, from the resolution rollup
+def get_resolution_counts():
+    df = _frame(RESOLUTION_SQL, columns=["resolution_hours", "Count"])
+    df["Count"] = df["Count"].astype(int)
+    return df
+
+
+def average_resolution_hours(resolution_counts):
+    total = resolution_counts["Count"].sum()
+    if not total:
+        return None
+    return (resolution_counts["resolution_hours"] * resolution_counts["Count"]).sum() / total
+
+
+# Ticket counts per customer name and status for the `limit` customers
+# with the most tickets plus an OTHER row per status, and the number of
+# customers with tickets
+def get_user_status_counts(limit=TOP_USERS):
+    df = _frame(USER_STATUS_TOP_SQL, (limit,), columns=["name", "status", "Count", "customers"])
+    customers = int(df["customers"].max()) if not df.empty else 0
+    df["Count"] = df["Count"].astype(int)
+    return df.groupby(["name", "status"], as_index=False)["Count"].sum(), customers
+
+
+def volume_period(first_day, last_day, max_points=MAX_POINTS):
+    span = (last_day - first_day).days + 1
+    for name, days, expr in VOLUME_PERIODS:
+        if span <= days * max_points:
+            return name, expr
+    return VOLUME_PERIODS[-1][0], VOLUME_PERIODS[-1][2]
+
+
+# Tickets raised per period and priority since `since` (all time if None),
+# from the daily rollup. Returns the period name and a frame indexed by
+# period start with one column per priority, at most about max_points rows.
+def get_ticket_volume(since=None, max_points=MAX_POINTS):
+    since = since or date(1970, 1, 1)
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(day), MAX(day) FROM ticket_daily_rollup WHERE day >= %s", (since,))
+        first_day, last_day = cursor.fetchone()
+        if first_day is None:
+            return VOLUME_PERIODS[0][0], pd.DataFrame()
+        period, expr = volume_period(first_day, last_day, max_points)
+        rows = _fetch(cursor, f"""
+            SELECT {expr} AS period, priority, SUM(ticket_count) AS Count
+            FROM ticket_daily_rollup
+            WHERE day >= %s
+            GROUP BY period, priority
+        """, (since,))
+    df = pd.DataFrame(rows, columns=["period", "priority", "Count"])
+    df["Count"] = df["Count"].astype(int)
+    return period, df.pivot_table(index="period", columns="priority", values="Count", aggfunc="sum", fill_value=0)
+
+
+WATERMARK_SQL = "SELECT MAX(ticket_id), MAX(status_changed_on) FROM support_ticket"
+WINDOW_COUNT_SQL = "SELECT COUNT(*) FROM support_ticket WHERE ticket_id > %s"
+
+# Ticket states the cache folds in: every ticket changed or created
+# within the overlap window, ordered by id
+CHANGES_SQL = """
+    SELECT ticket_id, priority, status, ticket_raised_on, ticket_closed_on
+    FROM support_ticket
+    WHERE ticket_id > %s OR status_changed_on >= %s
+    ORDER BY ticket_id
+"""
+
+# States tracked after a rebuild: the open tickets plus the overlap window
+TRACKED_SQL = """
+    SELECT ticket_id, priority, status, ticket_raised_on, ticket_closed_on
+    FROM support_ticket
+    WHERE status <> 'Closed' OR ticket_id > %s OR status_changed_on >= %s
+    ORDER BY ticket_id
+"""
+
+
+# In-process analytics cache shared by every session. A full rebuild reads
+# the rollups and GROUP BY aggregates in one snapshot; after that each
+# refresh only asks for MAX(ticket_id) / MAX(status_changed_on) and, if
+# either moved, folds the new or changed tickets into the aggregates in
+# place. Memory is bounded: only the last `max_tracked` ticket states are
+# kept. Topic counts come from the topic index, which callers refresh
+# separately so a failing index does not take the aggregates down. The
+# per-customer view is not kept here, as it would grow with the number of
+# customers: snapshot() reads the top customers from the database through
+# the result cache.
+# A change to a ticket whose prior state has been evicted triggers a full
+# rebuild, as does age.
+#
+# Transactions do not commit in id or timestamp order, so each refresh
+# re-reads an overlap window behind the watermark: the last `id_overlap`
+# ticket ids and the last `overlap_seconds` of status changes. Every ticket
+# in the window is tracked, so a re-read row whose status is unchanged is
+# a no-op and an untracked id inside the window is a late insert.
+class AnalyticsCache:
+    def __init__(self, max_tracked=50000, rebuild_after=3600,
+                 overlap_seconds=60, id_overlap=200):
+        self.max_tracked = max_tracked
+        self.rebuild_after = rebuild_after
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.id_overlap = id_overlap
+        self._lock = threading.Lock()
+        self._built_at = None
+        self.rebuilds = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def _status(status):
+        return status.strip().title()
+
+    def _track(self, ticket_id, state):
+        self._tracked[ticket_id] = state
+        self._tracked.move_to_end(ticket_id)
+        while len(self._tracked) > self.max_tracked:
+            self._tracked.popitem(last=False)
+
+    @staticmethod
+    def _state(row):
+        _, priority, status, raised_on, closed_on = row
+        status = AnalyticsCache._status(status)
+        hours = None
+        if status == "Closed" and closed_on is not None:
+            hours = _resolution_hours(raised_on, closed_on)
+        return priority, status, hours
+
+    # First ticket id and change time of the overlap window
+    def _window(self):
+        since_changed = (self._max_changed - self.overlap
+                         if self._max_changed else datetime(1970, 1, 1))
+        return self._max_id - self.id_overlap, since_changed
+
+    def _read_watermark(self, cursor):
+        cursor.execute(WATERMARK_SQL)
+        max_id, max_changed = cursor.fetchone()
+        return max_id or 0, max_changed
+
+    def _read_window_count(self, cursor):
+        cursor.execute(WINDOW_COUNT_SQL, (self._window()[0],))
+        return int(cursor.fetchone()[0])
+
+    def _rebuild(self):
+        with read_connection() as conn:
+            # One transaction, so every aggregate and the watermark come
+            # from the same InnoDB snapshot
+            conn.start_transaction(consistent_snapshot=True, readonly=True)
+            cursor = conn.cursor()
+            self._max_id, self._max_changed = self._read_watermark(cursor)
+            priority_status = _fetch(cursor, PRIORITY_STATUS_SQL)
+            resolution = _fetch(cursor, RESOLUTION_SQL)
+            tracked = _fetch(cursor, TRACKED_SQL, self._window())
+            self._window_count = self._read_window_count(cursor)
+            conn.commit()
+
+        self._priority_status = Counter()
+        for priority, status, count in priority_status:
+            self._priority_status[(priority, self._status(status))] += int(count)
+        self._resolution = Counter({int(hours): int(count) for hours, count in resolution})
+        self._tracked = OrderedDict()
+        for row in tracked:
+            self._track(row[0], self._state(row))
+
+        self._built_at = time.monotonic()
+        self.rebuilds += 1
+
+    def _apply(self, row, since_id):
+        ticket_id = row[0]
+        priority, status, hours = self._state(row)
+
+        previous = self._tracked.get(ticket_id)
+        if previous is None:
+            # Untracked below the window: evicted, its old state is unknown
+            if ticket_id <= since_id:
+                return False
+        else:
+            _, old_status, old_hours = previous
+            if old_status == status:
+                self._track(ticket_id, previous)
+                return True
+            self._priority_status[(priority, old_status)] -= 1
+            if old_hours is not None:
+                self._resolution[old_hours] -= 1
+
+        self._priority_status[(priority, status)] += 1
+        if hours is not None:
+            self._resolution[hours] += 1
+        self._track(ticket_id, (priority, status, hours))
+        return True
+
+    def _refresh(self):
+        since_id, since_changed = self._window()
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            max_id, max_changed = self._read_watermark(cursor)
+            window_count = self._read_window_count(cursor)
+            # Nothing moved, no late insert below the watermark, and the
+            # last change is too old for a late commit to land behind it
+            settled = (self._max_changed is None
+                       or datetime.now() - self._max_changed > self.overlap)
+            if (max_id == self._max_id and max_changed == self._max_changed
+                    and window_count == self._window_count and settled):
+                return
+            rows = _fetch(cursor, CHANGES_SQL, (since_id, since_changed))
+
+        for row in rows:
+            if not self._apply(row, since_id):
+                self._rebuild()
+                return
+        self._max_id = max(self._max_id, max_id)
+        if max_changed is not None:
+            self._max_changed = max(self._max_changed or max_changed, max_changed)
+        self._window_count = window_count
+        self.refreshes += 1
+
+    # Bring the cache up to date; cheap when nothing changed
+    def refresh(self, full=False):
+        with self._lock:
+            stale = (self._built_at is None
+                     or time.monotonic() - self._built_at > self.rebuild_after)
+            if full or stale:
+                self._rebuild()
+            else:
+                self._refresh()
+
+    # Aggregates in the shape of the get_* helpers above, in a stable row
+    # order so unchanged data hashes the same for the chart cache.
+    # user_status holds the top `user_limit` customers plus OTHER;
+    # user_total counts all customers with tickets.
+    def snapshot(self, user_limit=TOP_USERS):
+        with self._lock:
+            priority_status = pd.DataFrame(
+                sorted((p, s, n) for (p, s), n in self._priority_status.items() if n > 0),
+                columns=["priority", "status", "Count"],
+            )
+            resolution = pd.DataFrame(
+                sorted((h, n) for h, n in self._resolution.items() if n > 0),
+                columns=["resolution_hours", "Count"],
+            )
+        user_status, user_total = cached(("user_status_top", user_limit), ("tickets",),
+                                         lambda: get_user_status_counts(user_limit))
+        user_status = user_status.sort_values(["name", "status"], ignore_index=True)
+        return {
+            "priority_status": priority_status,
+            "resolution": resolution,
+            "user_status": user_status,
+            "user_total": user_total,
+            "top_subjects": get_topic_index().top_topics(5),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analytics_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalyticsCache()
+    return _cache
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+from db import db_connection
+from resultcache import invalidate
+from schema import ARCHIVE_TABLE, ensure_schema
+
+# Moves closed tickets older than ARCHIVE_AFTER_DAYS (by close date) from
+# support_ticket into support_ticket_archive, in batches of one
+# transaction each, so the hot table only holds open and recent tickets.
+# Rollups count every ticket and are not touched. Meant to run from cron:
+#
+#   python archive.py            # archive with the configured age
+#   python archive.py --dry-run  # only count what would move
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("CQMS_ARCHIVE_AFTER_DAYS", "180"))
+BATCH_SIZE = 1000
+
+
+def _cutoff(days):
+    return datetime.now() - timedelta(days=days)
+
+
+def count_archivable(days=ARCHIVE_AFTER_DAYS):
+    ensure_schema()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM support_ticket
+            WHERE status = 'Closed' AND ticket_closed_on < %s
+        """, (_cutoff(days),))
+        return cursor.fetchone()[0]
+
+
+# Move archivable tickets; returns how many were moved
+def archive_closed_tickets(days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE):
+    ensure_schema()
+    cutoff = _cutoff(days)
+    moved = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("""
+                SELECT ticket_id FROM support_ticket
+                WHERE status = 'Closed' AND ticket_closed_on < %s
+                ORDER BY ticket_closed_on LIMIT %s
+                FOR UPDATE
+            """, (cutoff, batch_size))
+            ticket_ids = [row[0] for row in cursor.fetchall()]
+            if not ticket_ids:
+                break
+            placeholders = ", ".join(["%s"] * len(ticket_ids))
+            cursor.execute(f"""
+                INSERT INTO {ARCHIVE_TABLE}
+                SELECT * FROM support_ticket WHERE ticket_id IN ({placeholders})
+            """, tuple(ticket_ids))
+            cursor.execute(f"DELETE FROM support_ticket WHERE ticket_id IN ({placeholders})",
+                           tuple(ticket_ids))
+            conn.commit()
+            moved += len(ticket_ids)
+    if moved:
+        invalidate("tickets")
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old closed tickets to the archive table")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive tickets closed more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only report how many would move")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        print(f"{count_archivable(args.days)} ticket(s) closed more than {args.days} days ago")
+        return 0
+    moved = archive_closed_tickets(args.days, args.batch_size)
+    print(f"Archived {moved} ticket(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
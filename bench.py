@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import mysql.connector
+import pandas as pd
+
+import analytics
+import db
+import schema
+import sla
+import tickets
+import topics
+import workqueue
+
+# Benchmarks for the CQMS data-access helpers against a seeded local MySQL
+# database (never the production one):
+#
+#   python bench.py --seed --tickets 200000   # create and fill cqms_bench
+#   python bench.py --save baseline.json      # run and keep the results
+#   python bench.py --compare baseline.json   # fail on p90 regressions
+#   python bench.py --writes                  # also time the write helpers
+#
+# The write benchmarks add tickets and claim queue entries on every call,
+# so they are left out unless --writes is given and the data set drifts
+# while they run: reseed before timing reads again or saving a baseline.
+
+PRIORITIES = (["Low"] * 50) + (["Medium"] * 35) + (["High"] * 15)
+# Median hours to resolve, by priority
+RESOLUTION_MEDIAN = {"High": 4, "Medium": 18, "Low": 60}
+SUBJECTS = [
+    "Login issue", "Password reset", "Billing question", "Invoice missing",
+    "Refund request", "App crashes on start", "Slow dashboard", "Data export",
+    "Account locked", "Feature request", "Integration error", "Email not received",
+]
+SUFFIXES = ["", "", "", "!", " again", " - urgent", " please help", "s"]
+CHUNK = 5000
+
+
+def _insert_many(cursor, query, rows):
+    for i in range(0, len(rows), CHUNK):
+        cursor.executemany(query, rows[i:i + CHUNK])
+
+
+# Create `name` if needed, point the pool at it and bring it up to date.
+# Must run before anything borrows a pooled connection.
+def use_database(name):
+    server = {k: v for k, v in db.DB_CONFIG.items() if k != "database"}
+    conn = mysql.connector.connect(**server)
+    conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{name}`")
+    conn.close()
+    db.DB_CONFIG["database"] = name
+    schema.migrate()
+
+
+# Fill the bench database with customers, their logins and tickets.
+# Tickets are spread over `days` days with more recent ones more likely to
+# still be open, and resolution times drawn from a log-normal per priority.
+def seed(customers, agents, ticket_count, days, rng):
+    with db.db_connection() as conn:
+        cursor = conn.cursor()
+        for table in ("support_ticket", schema.ARCHIVE_TABLE, "ticket_comment", "ticket_topic",
+                      "ticket_topic_assignment", "customer_profile", "user_login"):
+            cursor.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+        password = hashlib.sha256(b"password").hexdigest()
+        users = [(i + 1, f"Customer {i + 1}", f"customer{i + 1}@example.com", password, "Customer", "active")
+                 for i in range(customers)]
+        users += [(customers + i + 1, f"Agent {i + 1}", f"agent{i + 1}@example.com", password, "Support", "active")
+                  for i in range(agents)]
+        _insert_many(cursor, """
+            INSERT INTO user_login (user_id, name, email, password_hash, role, status)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, users)
+        _insert_many(cursor, """
+            INSERT INTO customer_profile (customer_id, user_id, company_name, phone, address)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(i + 1, i + 1, f"Company {i + 1}", f"555-{i:07d}", f"{i + 1} Example Street")
+              for i in range(customers)])
+
+        now = datetime.now()
+        start = now - timedelta(days=days)
+        rows = []
+        for _ in range(ticket_count):
+            # Skewed towards recent days, like real ticket volume growth
+            raised = start + timedelta(seconds=days * 86400 * rng.random() ** 0.7)
+            priority = rng.choice(PRIORITIES)
+            age_days = (now - raised).total_seconds() / 86400
+            hours = rng.lognormvariate(0, 1) * RESOLUTION_MEDIAN[priority]
+            closed = raised + timedelta(hours=hours)
+            if closed < now and rng.random() < min(0.97, 0.3 + age_days / 10):
+                status, closed_on = "Closed", closed
+            else:
+                status, closed_on = rng.choice(["Open", "Open", "In Progress"]), None
+            first_response = None
+            if status != "Open":
+                first_response = min(raised + timedelta(hours=hours * rng.random() * 0.3), now)
+            review = stars = None
+            if status == "Closed" and rng.random() < 0.4:
+                stars = rng.choices([1, 2, 3, 4, 5], [5, 5, 15, 35, 40])[0]
+                review = "Thanks for the help." if stars >= 4 else "Took too long."
+            subject = rng.choice(SUBJECTS) + rng.choice(SUFFIXES)
+            rows.append((
+                rng.randint(1, customers), subject,
+                f"{subject}. " + "Details of the problem. " * rng.randint(1, 20),
+                priority, status, raised, closed_on, review, stars, first_response,
+            ))
+        rows.sort(key=lambda r: r[5])
+        _insert_many(cursor, """
+            INSERT INTO support_ticket (customer_id, subject, description, priority, status,
+                                        ticket_raised_on, ticket_closed_on,
+                                        customer_review, review_stars, first_response_on)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, rows)
+        # Every answered ticket gets one agent comment at its first response
+        cursor.execute("""
+            INSERT INTO ticket_comment (ticket_id, author_id, body, created_at)
+            SELECT ticket_id, NULL, 'Looking into it.', first_response_on
+            FROM support_ticket WHERE first_response_on IS NOT NULL
+        """)
+        cursor.execute("UPDATE support_ticket SET comment_count = 1 WHERE first_response_on IS NOT NULL")
+        conn.commit()
+
+        for statement in schema.rollup_rebuild(cursor):
+            cursor.execute(statement)
+        conn.commit()
+
+
+# Size of one call's result, reported as "rows": rows of a list or frame,
+# the rows of a (rows, has_more) page, the summed frames of a cache
+# snapshot, and 1 for a single value such as a lookup or a write handle
+def _rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, tuple):
+        return _rows(result[0])
+    if isinstance(result, (list, pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, dict) and any(isinstance(v, (pd.DataFrame, pd.Series)) for v in result.values()):
+        return sum(len(v) for v in result.values() if isinstance(v, (pd.DataFrame, pd.Series)))
+    return 1
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Time `fn` over `repeat` calls, plus one extra call under tracemalloc for
+# the Python-side peak memory
+def measure(fn, repeat):
+    tracemalloc.start()
+    rows = _rows(fn())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": _percentile(timings, 50),
+        "p90_ms": _percentile(timings, 90),
+        "p99_ms": _percentile(timings, 99),
+        "max_ms": timings[-1],
+        "rows": rows,
+        "peak_kb": peak / 1024,
+    }
+
+
+def scenarios(rng, customers, writes=False):
+    first_page, _ = tickets.get_all_tickets(tickets.PAGE_SIZES[0])
+    deep_cursor = None
+    if first_page:
+        # A cursor roughly halfway back through history
+        with db.db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM support_ticket")
+            total = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT ticket_raised_on, ticket_id FROM support_ticket
+                ORDER BY ticket_raised_on DESC, ticket_id DESC LIMIT 1 OFFSET %s
+            """, (total // 2,))
+            deep_cursor = cursor.fetchone()
+
+    cache = analytics.AnalyticsCache()
+    cache.refresh()
+    password = hashlib.sha256(b"password").hexdigest()
+
+    def customer():
+        return rng.randint(1, customers)
+
+    benchmarks = {
+        "login": lambda: tickets.get_login_user(f"customer{customer()}@example.com", password, "Customer"),
+        "get_user_details": lambda: tickets.get_user_details(customer()),
+        "get_user_tickets": lambda: tickets.get_user_tickets(customer()),
+        "get_all_tickets (first page)": lambda: tickets.get_all_tickets(tickets.PAGE_SIZES[0]),
+        "get_all_tickets (deep page)": lambda: tickets.get_all_tickets(tickets.PAGE_SIZES[0], deep_cursor),
+        "get_ticket_details": lambda: tickets.get_ticket_details([t["ticket_id"] for t in first_page[:1]]),
+        "get_ticket_comments": lambda: tickets.get_ticket_comments(first_page[0]["ticket_id"]) if first_page else None,
+        "analytics: priority/status": analytics.get_priority_status_counts,
+        "analytics: resolution": analytics.get_resolution_counts,
+        "analytics: user/status top 10": lambda: analytics.get_user_status_counts(10)[0],
+        "analytics: ticket volume": lambda: analytics.get_ticket_volume()[1],
+        "topics: top topics": topics.get_top_topics,
+        "sla: percentiles, all time": sla.sla_percentiles,
+        "analytics cache: rebuild": lambda: cache.refresh(full=True),
+        "analytics cache: refresh": lambda: (cache.refresh(), cache.snapshot())[1],
+    }
+    if writes:
+        benchmarks.update({
+            "write: create_ticket": lambda: tickets.create_ticket(
+                customer(), "Benchmark ticket", "Created by bench.py", rng.choice(PRIORITIES)),
+            "write: workqueue claim next": lambda: workqueue.claim_next_ticket(1),
+        })
+    return benchmarks
+
+
+def report(results):
+    print(f"{'benchmark':34} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'rows':>8} {'peak KB':>9}")
+    for name, r in results.items():
+        print(f"{name:34} {r['p50_ms']:9.2f} {r['p90_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['max_ms']:9.2f} {r['rows']:8d} {r['peak_kb']:9.1f}")
+
+
+# Names whose p90 got more than `tolerance` slower than in the baseline
+def regressions(results, baseline, tolerance):
+    slower = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base and r["p90_ms"] > base["p90_ms"] * (1 + tolerance):
+            slower.append((name, base["p90_ms"], r["p90_ms"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CQMS data-access functions")
+    parser.add_argument("--database", default="cqms_bench", help="database to seed and benchmark")
+    parser.add_argument("--seed", action="store_true", help="recreate the synthetic data set first")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per benchmark")
+    parser.add_argument("--only", action="append", help="run only benchmarks whose name contains this")
+    parser.add_argument("--writes", action="store_true",
+                        help="also run the benchmarks that change data (reseed afterwards)")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p90 slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    if args.database == "cqms":
+        parser.error("refusing to benchmark the application database; use a separate --database")
+    use_database(args.database)
+
+    rng = random.Random(args.random_seed)
+    if args.seed:
+        started = time.perf_counter()
+        seed(args.customers, args.agents, args.tickets, args.days, rng)
+        print(f"Seeded {args.tickets} tickets in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    for name, fn in scenarios(rng, args.customers, args.writes).items():
+        if args.only and not any(part in name for part in args.only):
+            continue
+        results[name] = measure(fn, args.repeat)
+    report(results)
+    print(f"pool: {db.pool_stats()}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline, args.tolerance)
+        for name, before, after in slower:
+            print(f"REGRESSION {name}: p90 {before:.2f} ms -> {after:.2f} ms")
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
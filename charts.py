@@ -0,0 +1,111 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Rendered PNGs keyed by chart + a hash of the data that went into it, so
+# reruns with unchanged aggregates skip matplotlib entirely. Figures are
+# built with the object-oriented API, never registered with pyplot, and
+# cleared as soon as they are saved.
+MAX_CHARTS = 64
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _data_hash(data):
+    digest = hashlib.sha1()
+    digest.update(repr(list(data.columns) if isinstance(data, pd.DataFrame) else data.name).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def _render(draw, data, figsize, options):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    try:
+        ax = fig.add_subplot()
+        draw(ax, data, **options)
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight")
+        return buf.getvalue()
+    finally:
+        fig.clear()
+
+
+# PNG bytes for draw(ax, data, **options), served from the LRU cache when
+# the same chart was already rendered from identical data
+def chart_png(draw, data, figsize=(6, 4), **options):
+    key = (draw.__name__, figsize, repr(sorted(options.items())), _data_hash(data))
+    with _lock:
+        png = _cache.get(key)
+        if png is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return png
+        _stats["misses"] += 1
+
+    png = _render(draw, data, figsize, options)
+
+    with _lock:
+        _cache[key] = png
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CHARTS:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+    return png
+
+
+def chart_cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_cache))
+
+
+def _labels(ax, title, xlabel, ylabel):
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+
+
+# data: resolution_hours / Count
+def resolution_histogram(ax, data, bins=10):
+    ax.hist(data["resolution_hours"], bins=bins, weights=data["Count"])
+    _labels(ax, "Distribution of Ticket Resolution Times", "Resolution Time (hours)", "Number of Tickets")
+
+
+# data: two columns, labels then values
+def bar_chart(ax, data, title="", xlabel="", ylabel="", colors=None):
+    labels, values = data.columns[:2]
+    ax.bar(data[labels].astype(str), data[values], color=colors)
+    _labels(ax, title, xlabel, ylabel)
+
+
+# data: one row per group, one column per series (e.g. a priority x status pivot)
+def grouped_bar_chart(ax, data, title="", xlabel="", ylabel="", legend_title=None, rotation=0):
+    x = np.arange(len(data.index))
+    width = 0.8 / max(len(data.columns), 1)
+    for i, column in enumerate(data.columns):
+        ax.bar(x + i * width - 0.4 + width / 2, data[column], width, label=str(column))
+    ax.set_xticks(x, [str(v) for v in data.index], rotation=rotation,
+                  ha="right" if rotation else "center")
+    ax.legend(title=legend_title)
+    _labels(ax, title, xlabel, ylabel)
+
+
+# data: indexed by period, one column per series
+def line_chart(ax, data, title="", xlabel="", ylabel="", legend_title=None):
+    for column in data.columns:
+        ax.plot(data.index, data[column], label=str(column))
+    ax.legend(title=legend_title)
+    ax.tick_params(axis="x", labelrotation=30)
+    _labels(ax, title, xlabel, ylabel)
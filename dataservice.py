@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+from decimal import Decimal
+
+import tickets
+from db import DB_CONFIG, POOL_SIZE, wrote_recently
+from resultcache import cached
+from schema import ARCHIVE_TABLE, ensure_schema
+
+try:
+    import aiomysql
+except ImportError:  # only needed when the service is enabled
+    aiomysql = None
+
+# Read helpers shared by every Streamlit session. The pages import the
+# functions below instead of the ones in tickets.py; CQMS_DATA_SERVICE
+# picks the backend:
+#
+#   unset              call tickets.py directly, one blocking query per call
+#   inprocess          one asyncio loop per process, on its own thread, with
+#                      an aiomysql pool
+#   http://host:port   a separate `python dataservice.py serve` process
+#
+# Either service coalesces identical reads: a query already in flight is
+# awaited by every caller that asks for it, so 50 sessions opening the
+# dashboard at once run it once. A session that has just written skips
+# coalescing so it cannot be handed a result read before its own commit.
+# The service reads from the primary; read replicas (db.REPLICAS) only
+# apply to the direct mode.
+#
+# Whatever the backend, results are kept in this process's resultcache and
+# reused until a write helper invalidates what they were read from.
+
+MODE = os.environ.get("CQMS_DATA_SERVICE", "")
+CALL_TIMEOUT = float(os.environ.get("CQMS_DATA_SERVICE_TIMEOUT", "30"))
+DEFAULT_PORT = 8765
+
+# Read helper name -> tickets.py query builder
+READ_QUERIES = {
+    "get_user_details": tickets.user_details_query,
+    "get_user_name": tickets.user_name_query,
+    "get_user_tickets": tickets.user_tickets_query,
+    "get_all_tickets": tickets.all_tickets_query,
+    "search_tickets": tickets.search_query,
+    "get_ticket_comments": tickets.ticket_comments_query,
+}
+READS = set(READ_QUERIES) | {"get_ticket_details"}
+
+# Read helper name -> resultcache entities its result depends on, given
+# the call's arguments
+READ_ENTITIES = {
+    "get_user_details": lambda user_id: (("user", user_id),),
+    "get_user_name": lambda user_id: (("user", user_id),),
+    "get_user_tickets": lambda *args: ("tickets",),
+    "get_all_tickets": lambda *args: ("tickets",),
+    "search_tickets": lambda *args: ("tickets",),
+    "get_ticket_details": lambda *args: ("tickets",),
+    "get_ticket_comments": lambda ticket_id, *args: (("comments", ticket_id),),
+}
+
+
+class DataService:
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = pool_size
+        self._pool = None
+        self._inflight = {}
+        self.stats = {"calls": 0, "queries": 0, "coalesced": 0}
+
+    async def start(self):
+        if aiomysql is None:
+            raise RuntimeError("The data service needs aiomysql (pip install aiomysql)")
+        ensure_schema()
+        # autocommit: every query sees the latest committed data instead of
+        # the snapshot of a long-lived pooled transaction
+        self._pool = await aiomysql.create_pool(
+            host=DB_CONFIG["host"], user=DB_CONFIG["user"], password=DB_CONFIG["password"],
+            db=DB_CONFIG["database"], minsize=1, maxsize=self.pool_size, autocommit=True,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+
+    async def _execute(self, query, params):
+        self.stats["queries"] += 1
+        async with self._pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchall()
+
+    async def _query(self, query, params, fresh=False):
+        if query is None:
+            return []
+        key = (query, params)
+        task = None if fresh else self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._execute(query, params))
+            if not fresh:
+                self._inflight[key] = task
+                task.add_done_callback(lambda done: self._inflight.pop(key, None)
+                                       if self._inflight.get(key) is done else None)
+        # shield: one caller giving up must not cancel the shared query
+        rows = await asyncio.shield(task)
+        # Every caller gets its own row dicts
+        return [dict(row) for row in rows]
+
+    async def call(self, name, *args, fresh=False):
+        self.stats["calls"] += 1
+        if name == "get_ticket_details":
+            return await self._ticket_details(args[0], fresh)
+        query, params, finish = READ_QUERIES[name](*args)
+        return finish(await self._query(query, params, fresh))
+
+    async def _ticket_details(self, ticket_ids, fresh):
+        if not ticket_ids:
+            return {}
+        query, params, finish = tickets.ticket_details_query(ticket_ids)
+        details = finish(await self._query(query, params, fresh))
+        missing = [ticket_id for ticket_id in ticket_ids if ticket_id not in details]
+        if missing:
+            query, params, finish = tickets.ticket_details_query(missing, ARCHIVE_TABLE)
+            details.update(finish(await self._query(query, params, fresh)))
+        return details
+
+
+# Runs a DataService on a background event loop for the threads of this
+# process (one per Streamlit session)
+class InProcessClient:
+    def __init__(self):
+        self.service = DataService()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="cqms-data-service", daemon=True).start()
+        self._run(self.service.start())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(CALL_TIMEOUT)
+
+    def call(self, name, *args):
+        return self._run(self.service.call(name, *args, fresh=wrote_recently()))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def _dumps(value):
+    return json.dumps(value, default=_encode).encode()
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def call(self, name, *args):
+        request = urllib.request.Request(
+            self.url + "/call",
+            data=_dumps({"name": name, "args": args, "fresh": wrote_recently()}),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=CALL_TIMEOUT) as response:
+                result = _loads(response.read())["result"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"data service: {_loads(e.read()).get('error', e.reason)}") from e
+        if name == "get_ticket_details":
+            # JSON object keys are strings
+            result = {int(ticket_id): row for ticket_id, row in result.items()}
+        return result
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InProcessClient() if MODE == "inprocess" else HttpClient(MODE)
+    return _client
+
+
+def _call(name, *args):
+    if not MODE:
+        load = lambda: getattr(tickets, name)(*args)
+    else:
+        load = lambda: _get_client().call(name, *args)
+    # A session that has just written reads past the cache: another
+    # session may have refilled it from a replica that lags behind
+    if wrote_recently():
+        return load()
+    # repr: arguments include lists (ticket ids) and nested tuples
+    return cached((name, repr(args)), READ_ENTITIES[name](*args), load)
+
+
+def get_user_details(user_id):
+    return _call("get_user_details", user_id)
+
+
+def get_user_name(user_id):
+    return _call("get_user_name", user_id)
+
+
+def get_user_tickets(user_id, include_archived=False, filters=None, sort=tickets.DEFAULT_SORT):
+    return _call("get_user_tickets", user_id, include_archived, filters, sort)
+
+
+def get_all_tickets(page_size=tickets.PAGE_SIZES[0], after=None, archived=False, filters=None,
+                    sort=tickets.DEFAULT_SORT):
+    return _call("get_all_tickets", page_size, after, archived, filters, sort)
+
+
+def search_tickets(text, page_size=tickets.PAGE_SIZES[0], page=0, filters=None):
+    return _call("search_tickets", text, page_size, page, filters)
+
+
+def get_ticket_details(ticket_ids):
+    return _call("get_ticket_details", list(ticket_ids))
+
+
+def get_ticket_comments(ticket_id, page_size=tickets.COMMENT_PAGE_SIZE, before=None):
+    return _call("get_ticket_comments", ticket_id, page_size, before)
+
+
+# Minimal HTTP/1.1 front end: POST /call {"name", "args", "fresh"} and
+# GET /stats, JSON in and out, one request per connection
+async def _handle(service, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode().split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        status = "200 OK"
+        if request_line[:2] == ["GET", "/stats"]:
+            payload = dict(service.stats, inflight=len(service._inflight))
+        elif request_line[:2] == ["POST", "/call"]:
+            request = _loads(body)
+            if request.get("name") not in READS:
+                status, payload = "404 Not Found", {"error": f"unknown read {request.get('name')!r}"}
+            else:
+                try:
+                    result = await service.call(request["name"], *request.get("args", []),
+                                                fresh=bool(request.get("fresh")))
+                    payload = {"result": result}
+                except Exception as e:
+                    status, payload = "500 Internal Server Error", {"error": str(e)}
+        else:
+            status, payload = "404 Not Found", {"error": "not found"}
+
+        data = _dumps(payload)
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host, port):
+    service = DataService()
+    await service.start()
+    server = await asyncio.start_server(lambda r, w: _handle(service, r, w), host, port)
+    print(f"CQMS data service on http://{host}:{port}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CQMS async data service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("serve", help="serve the read helpers over HTTP/JSON")
+    run.add_argument("--host", default="127.0.0.1")
+    run.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
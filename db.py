@@ -1,15 +1,389 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import mysql.connector
 import streamlit as st
 
+import querylog
+
+DB_CONFIG = {
+    "host": os.environ.get("CQMS_DB_HOST", "localhost"),
+    "user": os.environ.get("CQMS_DB_USER", "root"),
+    "password": os.environ.get("CQMS_DB_PASSWORD", "Sedhu.k001@"),
+    "database": os.environ.get("CQMS_DB_NAME", "cqms"),
+}
+
+# Pool sizing, overridable per deployment
+POOL_SIZE = int(os.environ.get("CQMS_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("CQMS_DB_POOL_TIMEOUT", "10"))
+
+# Optional read replicas as host[:port] list, e.g.
+# CQMS_DB_REPLICAS=replica1,replica2:3307. Same user, password and database
+# as the primary. read_connection() spreads reads over them round-robin;
+# a replica that fails to connect, has stopped replicating or lags more
+# than MAX_REPLICA_LAG seconds is skipped for REPLICA_RETRY seconds, and
+# reads fall back to the primary when none is usable. A session that
+# committed a write reads from the primary for READ_YOUR_WRITES seconds,
+# so it always sees its own changes.
+REPLICAS = [h.strip() for h in os.environ.get("CQMS_DB_REPLICAS", "").split(",") if h.strip()]
+REPLICA_RETRY = float(os.environ.get("CQMS_DB_REPLICA_RETRY", "30"))
+MAX_REPLICA_LAG = float(os.environ.get("CQMS_DB_MAX_REPLICA_LAG", "5"))
+LAG_CHECK_INTERVAL = 5
+READ_YOUR_WRITES = float(os.environ.get("CQMS_DB_READ_YOUR_WRITES", "10"))
+
+
+# Connection handed out by the pool; close() gives it back instead of
+# tearing down the socket, so existing callers keep working unchanged.
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._cursors = []
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to pool")
+        return getattr(self._conn, name)
+
+    # Cursors are wrapped so every statement is recorded in querylog
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        if not querylog.ENABLED:
+            return cursor
+        cursor = querylog.InstrumentedCursor(cursor)
+        self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        if self._conn is not None:
+            for cursor in self._cursors:
+                cursor._close_entry()
+            self._cursors = []
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, **config):
+        self.size = size
+        self.timeout = timeout
+        self.config = config
+        # Idle connections, most recently used last. Waiters sleep on
+        # _available, which is notified whenever a connection is returned
+        # or a slot frees up because one was discarded.
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.config)
+
+    # Reuse an idle connection if one is alive, otherwise reconnect it
+    def _healthy(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self._reconnects += 1
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        return self._connect()
+
+    # Give up a connection's slot so a waiter can open a new one
+    def _discard(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+        with self._available:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise mysql.connector.errors.PoolError(
+                        f"No connection available after {self.timeout:.1f}s "
+                        f"(pool size {self.size})"
+                    )
+                self._available.wait(remaining)
+
+        try:
+            conn = self._healthy(conn) if conn is not None else self._connect()
+        except mysql.connector.Error:
+            self._discard()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        # End any transaction left open so the next borrower gets a fresh
+        # snapshot instead of stale REPEATABLE READ data
+        try:
+            conn.rollback()
+        except mysql.connector.Error:
+            try:
+                conn.close()
+            except mysql.connector.Error:
+                pass
+            with self._lock:
+                self._in_use -= 1
+            self._discard()
+            return
+        with self._available:
+            self._in_use -= 1
+            self._idle.append(conn)
+            self._available.notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "reconnects": self._reconnects,
+                "wait_total_s": self._wait_total,
+                "wait_avg_s": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_max_s": self._wait_max,
+            }
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except mysql.connector.Error:
+                pass
+            self._discard()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Process-wide pool, created on first use and shared by every session
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**DB_CONFIG)
+    return _pool
+
+
+# Round-robin over the replica pools, skipping unhealthy replicas
+class ReplicaSet:
+    def __init__(self, hosts, retry=REPLICA_RETRY, max_lag=MAX_REPLICA_LAG, **config):
+        self.retry = retry
+        self.max_lag = max_lag
+        self.replicas = []
+        for host in hosts:
+            name, _, port = host.partition(":")
+            replica_config = dict(config, host=name)
+            if port:
+                replica_config["port"] = int(port)
+            self.replicas.append({
+                "host": host,
+                "pool": ConnectionPool(**replica_config),
+                "down_until": 0.0,
+                "lag_checked": 0.0,
+                "failures": 0,
+            })
+        self._lock = threading.Lock()
+        self._next = 0
+        self.reads = 0
+        self.fallbacks = 0
+
+    def _mark_down(self, replica):
+        with self._lock:
+            replica["down_until"] = time.monotonic() + self.retry
+            replica["failures"] += 1
+
+    # Seconds behind the primary; None if replication is stopped, 0 when
+    # the server is not a replica at all
+    @staticmethod
+    def _lag(conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return 0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
+
+    def _usable(self, replica, conn):
+        now = time.monotonic()
+        if now - replica["lag_checked"] < LAG_CHECK_INTERVAL:
+            return True
+        replica["lag_checked"] = now
+        try:
+            lag = self._lag(conn)
+        except mysql.connector.Error:
+            # No REPLICATION CLIENT privilege: cannot tell, trust the ping
+            return True
+        return lag is not None and lag <= self.max_lag
+
+    # A connection to the next healthy replica, or None
+    def acquire(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        now = time.monotonic()
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica["down_until"] > now:
+                continue
+            try:
+                conn = replica["pool"].acquire()
+            except mysql.connector.Error:
+                self._mark_down(replica)
+                continue
+            if not self._usable(replica, conn):
+                conn.close()
+                self._mark_down(replica)
+                continue
+            with self._lock:
+                self.reads += 1
+            return conn
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "reads": self.reads,
+            "fallbacks_to_primary": self.fallbacks,
+            "replicas": [
+                dict(replica["pool"].stats(), host=replica["host"],
+                     healthy=replica["down_until"] <= now, failures=replica["failures"])
+                for replica in self.replicas
+            ],
+        }
+
+
+_replicas = None
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None and REPLICAS:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = ReplicaSet(REPLICAS, **DB_CONFIG)
+    return _replicas
+
+
+_last_write = {}
+_last_write_lock = threading.Lock()
+
+
+def _current_session():
+    rerun = querylog.current_rerun()
+    return rerun.session if rerun else None
+
+
+# Pin the current session's reads to the primary for READ_YOUR_WRITES
+# seconds. Called by the write helpers, only when they changed rows, so
+# read-only transactions on the primary do not pin the session.
+def note_write():
+    session = _current_session()
+    if session is None:
+        return
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write[session] = now
+        if len(_last_write) > 1000:
+            for key in [k for k, t in _last_write.items() if now - t > READ_YOUR_WRITES]:
+                del _last_write[key]
+
+
+# Whether the current session committed within READ_YOUR_WRITES seconds
+def wrote_recently():
+    session = _current_session()
+    if session is None:
+        return False
+    with _last_write_lock:
+        written = _last_write.get(session)
+    return written is not None and time.monotonic() - written < READ_YOUR_WRITES
+
+
+def pool_stats():
+    stats = get_pool().stats()
+    replicas = get_replicas()
+    if replicas is not None:
+        stats["read_replicas"] = replicas.stats()
+    return stats
+
+
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user="root",         
-            password="Sedhu.k001@",
-            database="cqms"
-        )
-        return conn
+        return get_pool().acquire()
     except mysql.connector.Error as e:
         st.error(f"Database connection error: {e}")
         return None
+
+
+# Borrow a connection for the duration of a with-block; it is always
+# returned to the pool, even if the block raises.
+@contextmanager
+def db_connection():
+    conn = get_pool().acquire()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# Like db_connection(), but for read-only work: served by a replica when
+# any are configured and healthy, unless this session has just written.
+@contextmanager
+def read_connection():
+    conn = None
+    replicas = get_replicas()
+    if replicas is not None and not wrote_recently():
+        conn = replicas.acquire()
+    if conn is None:
+        conn = get_pool().acquire()
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import io
+import sys
+from datetime import datetime, timedelta
+
+from db import read_connection
+from schema import ALL_TICKETS, ensure_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# Streams tickets joined with their customer out of MySQL in fixed-size
+# chunks through an unbuffered (server-side) cursor, writing CSV or Parquet
+# as it goes, so memory stays flat however many tickets match.
+#
+#   python export.py --format parquet --out closed.parquet --status Closed --from 2025-01-01
+
+CHUNK_SIZE = 5000
+FORMATS = ["csv", "parquet"]
+# GROUP_CONCAT limit for the comments column; MySQL's default is 1024 bytes
+COMMENTS_MAX_LEN = 1 << 20
+STATUSES = ["Open", "In Progress", "Closed"]
+PRIORITIES = ["Low", "Medium", "High"]
+
+EXPORT_COLUMNS = [
+    ("ticket_id", "t.ticket_id"),
+    ("customer_id", "t.customer_id"),
+    ("company_name", "c.company_name"),
+    ("phone", "c.phone"),
+    ("customer_name", "u.name"),
+    ("email", "u.email"),
+    ("subject", "t.subject"),
+    ("description", "t.description"),
+    ("priority", "t.priority"),
+    ("status", "t.status"),
+    ("ticket_raised_on", "t.ticket_raised_on"),
+    ("ticket_closed_on", "t.ticket_closed_on"),
+    # The comment thread, oldest first, blank-line separated
+    ("comments", "(SELECT GROUP_CONCAT(tc.body ORDER BY tc.created_at, tc.comment_id SEPARATOR '\\n\\n') "
+                 "FROM ticket_comment tc WHERE tc.ticket_id = t.ticket_id)"),
+    ("customer_review", "t.customer_review"),
+    ("review_stars", "t.review_stars"),
+]
+
+
+def _parquet_schema():
+    types = {
+        "ticket_id": pa.int64(), "customer_id": pa.int64(), "review_stars": pa.int64(),
+        "ticket_raised_on": pa.timestamp("us"), "ticket_closed_on": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name, _ in EXPORT_COLUMNS])
+
+
+# SQL and parameters for the export; dates are inclusive days. Archived
+# tickets are only read with include_archived=True.
+def export_query(date_from=None, date_to=None, statuses=None, priorities=None,
+                 include_archived=False):
+    select = ",\n            ".join(f"{expr} AS {name}" for name, expr in EXPORT_COLUMNS)
+    where, params = [], []
+    if date_from:
+        where.append("t.ticket_raised_on >= %s")
+        params.append(date_from)
+    if date_to:
+        where.append("t.ticket_raised_on < %s")
+        params.append(date_to + timedelta(days=1))
+    if statuses:
+        where.append(f"t.status IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    if priorities:
+        where.append(f"t.priority IN ({', '.join(['%s'] * len(priorities))})")
+        params.extend(priorities)
+    # The limit is set for this statement only, not left on the pooled
+    # connection for whoever borrows it next
+    query = f"""
+        SELECT /*+ SET_VAR(group_concat_max_len = {COMMENTS_MAX_LEN}) */
+            {select}
+        FROM {ALL_TICKETS if include_archived else "support_ticket"} t
+        JOIN customer_profile c ON t.customer_id = c.customer_id
+        JOIN user_login u ON c.user_id = u.user_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY t.ticket_raised_on, t.ticket_id
+    """
+    return query, tuple(params)
+
+
+# Yield lists of row tuples, `chunk_size` at a time
+def iter_ticket_chunks(chunk_size=CHUNK_SIZE, **filters):
+    ensure_schema()
+    query, params = export_query(**filters)
+    with read_connection() as conn:
+        # Unbuffered: rows stay on the server until fetched
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+
+
+def _write_csv(out, chunks):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    text.detach()
+    return count
+
+
+def _write_parquet(out, chunks):
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = _parquet_schema()
+    count = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            count += len(rows)
+    return count
+
+
+# Write matching tickets to the binary file object `out`; returns the
+# number of tickets written
+def export_tickets(out, fmt="csv", chunk_size=CHUNK_SIZE, **filters):
+    chunks = iter_ticket_chunks(chunk_size, **filters)
+    if fmt == "parquet":
+        return _write_parquet(out, chunks)
+    return _write_csv(out, chunks)
+
+
+def _date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export CQMS tickets to CSV or Parquet")
+    parser.add_argument("--out", required=True, help="output file, or - for stdout (CSV only)")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--from", dest="date_from", type=_date, help="first raise date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", type=_date, help="last raise date, YYYY-MM-DD")
+    parser.add_argument("--status", action="append", help="repeatable")
+    parser.add_argument("--priority", action="append", help="repeatable")
+    parser.add_argument("--include-archived", action="store_true", help="also export archived tickets")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    filters = dict(date_from=args.date_from, date_to=args.date_to,
+                   statuses=args.status, priorities=args.priority,
+                   include_archived=args.include_archived)
+    if args.out == "-":
+        if args.format != "csv":
+            parser.error("only CSV can be written to stdout")
+        count = export_tickets(sys.stdout.buffer, "csv", args.chunk_size, **filters)
+    else:
+        with open(args.out, "wb") as out:
+            count = export_tickets(out, args.format, args.chunk_size, **filters)
+    print(f"Exported {count} tickets", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
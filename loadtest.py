@@ -0,0 +1,295 @@
+import argparse
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.testing.v1 import AppTest
+
+import bench
+import db
+
+# Drives the real pages headlessly with Streamlit's AppTest, many simulated
+# sessions at once in this process, against the seeded bench database:
+#
+#   python bench.py --seed --tickets 50000
+#   python loadtest.py --sessions 50 --duration 60
+#   python loadtest.py --mix customer_create=1,agent_analytics=3
+#
+# Each session logs in and repeats its scenario until the time is up.
+# Reported: reruns per second, latency percentiles per action, pool
+# connections in use (peak) and created, and peak RSS growth per session.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "password"
+RUN_TIMEOUT = 60
+CUSTOMER_PAGE = "pages/1_Customer.py"
+SUPPORT_PAGE = "pages/2_Support.py"
+
+
+class Session:
+    def __init__(self, name, stats):
+        self.name = name
+        self.stats = stats
+        self.at = AppTest.from_file(os.path.join(ROOT, "login.py"), default_timeout=RUN_TIMEOUT)
+
+    def _run(self):
+        self.at.run()
+        self.stats.rerun()
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+
+    def _button(self, label_prefix):
+        for button in self.at.button:
+            if button.label.startswith(label_prefix):
+                return button
+        return None
+
+    # Time one user action; `action` performs the widget changes and reruns
+    def act(self, label, action):
+        started = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            self.stats.error(label, e)
+            return False
+        self.stats.timing(label, (time.perf_counter() - started) * 1000)
+        return True
+
+    def login(self, email, role, page):
+        def action():
+            self._run()
+            self.at.text_input[0].input(email)
+            self.at.text_input[1].input(PASSWORD)
+            self.at.selectbox[0].select(role)
+            # Not _run(): how st.switch_page surfaces under AppTest varies
+            # by Streamlit version, so switch explicitly below
+            self.at.button[0].click().run()
+            self.stats.rerun()
+            state = self.at.session_state
+            if "logged_in" not in state or not state["logged_in"]:
+                raise RuntimeError(f"login failed for {email}")
+            self.at.switch_page(page)
+            self._run()
+        return self.act("login", action)
+
+    def section(self, key, value):
+        def action():
+            self.at.radio(key=key).set_value(value)
+            self._run()
+        return self.act(f"open {value}", action)
+
+    def create_ticket(self, rng):
+        def action():
+            self.at.text_input[0].input(f"Load test ticket {rng.randint(1, 10 ** 6)}")
+            self.at.text_area[0].input("Created by loadtest.py")
+            self.at.selectbox[0].select(rng.choice(["Low", "Medium", "High"]))
+            self._button("🚀 Submit Ticket").click()
+            self._run()
+        return self.act("create ticket", action)
+
+    # Open tickets one by one until one can be closed, then close it
+    def close_ticket(self, attempts=5):
+        def action():
+            toggles = [b.key for b in self.at.button if b.key and b.key.startswith("toggle_")]
+            for key in toggles[:attempts]:
+                self.at.button(key=key).click()
+                self._run()
+                close = self._button("🛑 Close Ticket")
+                if close is not None:
+                    close.click()
+                    self._run()
+                    return
+            raise RuntimeError("no open ticket to close")
+        return self.act("close ticket", action)
+
+    # Claim the next queued ticket and close it; the claim opens it
+    def claim_and_close(self):
+        def action():
+            self.at.button(key="claim_next").click()
+            self._run()
+            close = self._button("🛑 Close Ticket")
+            if close is None:
+                raise RuntimeError("queue is empty")
+            close.click()
+            self._run()
+        return self.act("claim and close", action)
+
+    def next_page(self):
+        def action():
+            self.at.button(key="tickets_next").click()
+            self._run()
+        return self.act("next ticket page", action)
+
+
+def customer_create(session, rng, customers):
+    yield session.login(f"customer{rng.randint(1, customers)}@example.com", "Customer", CUSTOMER_PAGE)
+    while True:
+        yield session.section("customer_section", "🆕 Create New Ticket")
+        yield session.create_ticket(rng)
+        yield session.section("customer_section", "📋 My Tickets")
+
+
+def customer_close(session, rng, customers):
+    yield session.login(f"customer{rng.randint(1, customers)}@example.com", "Customer", CUSTOMER_PAGE)
+    while True:
+        yield session.section("customer_section", "🔒 Close Tickets")
+        yield session.close_ticket()
+        yield session.section("customer_section", "👤 My Profile")
+
+
+def agent_analytics(session, rng, agents):
+    yield session.login(f"agent{rng.randint(1, agents)}@example.com", "Support", SUPPORT_PAGE)
+    while True:
+        yield session.section("support_section", "📊 Analytics")
+        yield session.section("support_section", "📋 Ticket Management")
+
+
+def agent_tickets(session, rng, agents):
+    yield session.login(f"agent{rng.randint(1, agents)}@example.com", "Support", SUPPORT_PAGE)
+    while True:
+        yield session.next_page()
+        yield session.next_page()
+        yield session.section("support_section", "📊 Analytics")
+        yield session.section("support_section", "📋 Ticket Management")
+
+
+def agent_queue(session, rng, agents):
+    yield session.login(f"agent{rng.randint(1, agents)}@example.com", "Support", SUPPORT_PAGE)
+    yield session.section("support_section", "🎯 Work Queue")
+    while True:
+        yield session.claim_and_close()
+
+
+SCENARIOS = {
+    "customer_create": (customer_create, "customers"),
+    "customer_close": (customer_close, "customers"),
+    "agent_analytics": (agent_analytics, "agents"),
+    "agent_tickets": (agent_tickets, "agents"),
+    "agent_queue": (agent_queue, "agents"),
+}
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reruns = 0
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(list)
+
+    def rerun(self):
+        with self._lock:
+            self.reruns += 1
+
+    def timing(self, label, ms):
+        with self._lock:
+            self.timings[label].append(ms)
+
+    def error(self, label, e):
+        with self._lock:
+            self.errors[label].append(str(e))
+
+
+# Samples the pool while the test runs
+class PoolMonitor(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_in_use = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_in_use = max(self.peak_in_use, db.pool_stats()["in_use"])
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_session(index, scenario, args, stats, deadline):
+    rng = random.Random(args.random_seed * 100003 + index)
+    flow, population = SCENARIOS[scenario]
+    session = Session(f"{scenario}-{index}", stats)
+    for step, ok in enumerate(flow(session, rng, getattr(args, population))):
+        # Without a login there is nothing left to do
+        if time.monotonic() >= deadline or (step == 0 and not ok):
+            break
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def report(stats, elapsed, sessions, monitor, rss_before):
+    print(f"{sessions} sessions, {elapsed:.1f}s, {stats.reruns} reruns, {stats.reruns / elapsed:.1f} reruns/s")
+    print(f"{'action':28} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>6}")
+    for label in sorted(set(stats.timings) | set(stats.errors)):
+        timings = sorted(stats.timings.get(label, []))
+        p = [bench._percentile(timings, pct) for pct in (50, 90, 99)]
+        print(f"{label:28} {len(timings):6d} {p[0]:9.1f} {p[1]:9.1f} {p[2]:9.1f} "
+              f"{timings[-1] if timings else 0:9.1f} {len(stats.errors.get(label, [])):6d}")
+    pool = db.pool_stats()
+    print(f"pool: peak in use {monitor.peak_in_use} of {pool['size']}, created {pool['created']}, "
+          f"avg wait {pool['wait_avg_s'] * 1000:.1f} ms, max wait {pool['wait_max_s'] * 1000:.1f} ms")
+    rss_growth = _peak_rss_kb() - rss_before
+    print(f"memory: peak RSS grew {rss_growth / 1024:.1f} MB, ~{rss_growth / max(sessions, 1):.0f} KB per session")
+    for label, errors in stats.errors.items():
+        print(f"first error in {label}: {errors[0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the CQMS pages")
+    parser.add_argument("--database", default="cqms_bench", help="seeded database (see bench.py --seed)")
+    parser.add_argument("--customers", type=int, default=2000, help="customers in the seeded data")
+    parser.add_argument("--agents", type=int, default=20, help="agents in the seeded data")
+    parser.add_argument("--sessions", type=int, default=20, help="simulated concurrent sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("customer_create,customer_close,agent_analytics,agent_tickets"),
+                        help="scenario=weight list, e.g. customer_create=3,agent_analytics=1")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.database == "cqms":
+        parser.error("refusing to load-test the application database; use a separate --database")
+    bench.use_database(args.database)
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    rng = random.Random(args.random_seed)
+    plan = [rng.choices(names, weights)[0] for _ in range(args.sessions)]
+
+    stats = Stats()
+    monitor = PoolMonitor()
+    monitor.start()
+    rss_before = _peak_rss_kb()
+    started = time.monotonic()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [executor.submit(run_session, i, scenario, args, stats, deadline)
+                   for i, scenario in enumerate(plan)]
+        for future in futures:
+            future.result()
+    elapsed = time.monotonic() - started
+    monitor.stop()
+
+    report(stats, elapsed, args.sessions, monitor, rss_before)
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
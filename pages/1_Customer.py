@@ -1,69 +1,26 @@
 import streamlit as st
-from datetime import datetime
-from db import get_db_connection
-
-
-
-
-#  Get user details
-def get_user_details(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM customer_profile WHERE user_id = %s", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
-
-def get_user_name(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("select name from user_login where user_id = %s", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
-
-#  Update user details
-def update_user_details(user_id, phone, address):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE customer_profile 
-        SET phone = %s, address = %s 
-        WHERE user_id = %s
-    """, (phone, address, user_id))
-    conn.commit()
-    conn.close()
-
-def create_ticket(customer_id, heading, description, priority):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO support_ticket (customer_id,subject,description, priority, status, ticket_raised_on)
-        VALUES (%s, %s, %s, %s, 'open', %s)
-    """, (customer_id,heading, description, priority, datetime.now()))
-    conn.commit()
-    conn.close()
-
-
-def get_user_tickets(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT ticket_id, subject, priority, status, ticket_raised_on,ticket_closed_on
-        FROM support_ticket
-        WHERE customer_id = %s
-        ORDER BY ticket_raised_on DESC
-    """, (user_id,))
-    tickets = cursor.fetchall()
-    conn.close()
-    return tickets
-
+from sections import (
+    begin_page,
+    comment_thread,
+    invalidate_session_data,
+    pending_writes_status,
+    query_debug_panel,
+    section_nav,
+    session_cached,
+    submit_write,
+    ticket_filter_controls,
+)
+from dataservice import get_ticket_details, get_user_details, get_user_name, get_user_tickets
+from tickets import DEFAULT_SORT, create_ticket, save_review, update_ticket_status, update_user_details
+
+
+begin_page("customer")
 
 if "logged_in" not in st.session_state or not st.session_state.logged_in:
     st.error("Please login first.")
     st.stop()
 user_id = st.session_state.user_id
-profile = get_user_name(user_id)
+profile = session_cached("user_name", get_user_name, user_id)
 user_name = profile["name"] if profile else "User"
 
 st.set_page_config(page_title= "customer Dashboard", page_icon="🛠️")
@@ -76,13 +33,15 @@ with col2:
         st.session_state.login = False
         st.session_state.role = None
         st.switch_page("login.py")
+
+pending_writes_status()
         
-customer_id = ''
+profile = session_cached("profile", get_user_details, user_id)
+customer_id = profile["customer_id"] if profile else ''
 
-tab1, tab2,tab3,tab4 = st.tabs(["👤 My Profile", "🆕 Create New Ticket","📋 My Tickets","🔒 Close Tickets"])
+section = section_nav(["👤 My Profile", "🆕 Create New Ticket","📋 My Tickets","🔒 Close Tickets"], key="customer_section")
 
-with tab1:
-    profile = get_user_details(user_id)
+if section == "👤 My Profile":
 
     if not profile:
         st.warning("⚠️ No profile data found for this user.")
@@ -94,15 +53,15 @@ with tab1:
             st.text_input("Name", value=profile["company_name"], disabled=True)
             phone = st.text_input("Phone", value=profile["phone"])
             address = st.text_area("Address", value=profile["address"])
-            customer_id = profile["customer_id"]
 
             update_btn = st.form_submit_button("💾 Update Profile")
 
             if update_btn:
-                update_user_details(user_id, phone, address)
+                submit_write("Profile update", update_user_details, user_id, phone, address)
+                invalidate_session_data("profile")
                 st.success("✅ Profile updated successfully!")
 
-with tab2:
+elif section == "🆕 Create New Ticket":
     st.subheader("Create New Support Ticket")
     with st.form("ticket_form"):
         query_heading = st.text_input("Query Heading")
@@ -112,17 +71,21 @@ with tab2:
         submit_ticket = st.form_submit_button("🚀 Submit Ticket")
 
         if submit_ticket:
-            create_ticket(customer_id, query_heading, query_description, priority)
+            submit_write("New ticket", create_ticket, customer_id, query_heading, query_description, priority)
             st.success("✅ Your support ticket has been created successfully!")
             query_description = ''
             query_heading = ''
             priority = 'Low'
 
-with tab3:
+elif section == "📋 My Tickets":
     st.subheader("📋 My Submitted Tickets")
-    tickets = get_user_tickets(customer_id)
+    include_archived = st.checkbox("Include archived tickets", key="include_archived")
+    filters, sort = ticket_filter_controls("my_tickets_filter")
+    tickets = get_user_tickets(customer_id, include_archived, filters, sort)
 
-    if not tickets:
+    if not tickets and filters:
+        st.info("No tickets match these filters.")
+    elif not tickets:
         st.info("No tickets found. You haven’t raised any support queries yet.")
     else:
         
@@ -132,21 +95,28 @@ with tab3:
         </style>
         """, unsafe_allow_html=True)
 
+        # Format copies so the cached rows keep their datetimes
+        rows = []
         for t in tickets:
-            t["ticket_raised_on"] = t["ticket_raised_on"].strftime("%Y-%m-%d %H:%M:%S")
+            row = dict(t)
+            row["ticket_raised_on"] = t["ticket_raised_on"].strftime("%Y-%m-%d %H:%M:%S")
             if t["ticket_closed_on"] not in (None, '', 'null'):
-                t["ticket_closed_on"] = t["ticket_closed_on"].strftime("%Y-%m-%d %H:%M:%S")
+                row["ticket_closed_on"] = t["ticket_closed_on"].strftime("%Y-%m-%d %H:%M:%S")
             else:
-                  t["ticket_closed_on"] = ''
+                  row["ticket_closed_on"] = ''
+            rows.append(row)
 
 
         st.dataframe(
-            tickets,
+            rows,
             use_container_width=True,
             hide_index=True
         )
 
-with tab4:
+elif section == "🔒 Close Tickets":
+    # Same arguments as an unfiltered "My Tickets", so both read one
+    # resultcache entry
+    tickets = get_user_tickets(customer_id, False, (), DEFAULT_SORT)
     if not tickets:
         st.info("No tickets found. You haven’t raised any support queries yet.")
     else:
@@ -185,7 +155,18 @@ with tab4:
                 </div>
             """, unsafe_allow_html=True)
 
-            with st.expander("View Details"):
+            is_open = st.session_state.get("open_ticket") == ticket["ticket_id"]
+            if st.button("Hide Details" if is_open else "View Details", key=f"toggle_{ticket['ticket_id']}"):
+                st.session_state.open_ticket = None if is_open else ticket["ticket_id"]
+                st.rerun()
+
+            if not is_open:
+                continue
+
+            # Only the opened ticket's heavy columns are fetched
+            details = get_ticket_details([ticket["ticket_id"]])[ticket["ticket_id"]]
+
+            with st.container(border=True):
                 st.markdown(f"**Ticket ID:** {ticket['ticket_id']}")
                 st.markdown(f"**Priority:** {ticket['priority']}")
 
@@ -195,37 +176,22 @@ with tab4:
                 st.markdown(f"**Created At:** {created_at}")
                 st.markdown("---")
 
-                
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute("""
-                    SELECT description, comments, status, customer_review, review_stars 
-                    FROM support_ticket 
-                    WHERE ticket_id = %s
-                """, (ticket["ticket_id"],))
-                details = cursor.fetchone()
-                conn.close()
-
                 st.markdown(f"**Description:** {details['description']}")
-                st.markdown(f"**Comments:** {details['comments'] or 'No comments yet'}")
+                st.markdown("**Comments:**")
+                comment_thread(ticket["ticket_id"])
                 st.markdown("---")
 
                
-                if details["status"] == "Open":
+                if ticket["status"].lower() == "open":
                     if st.button(f"🛑 Close Ticket #{ticket['ticket_id']}"):
-                        conn = get_db_connection()
-                        cursor = conn.cursor()
-                        cursor.execute("""
-                            UPDATE support_ticket 
-                            SET status = 'Closed', ticket_closed_on = NOW()
-                            WHERE ticket_id = %s
-                        """, (ticket["ticket_id"],))
-                        conn.commit()
-                        conn.close()
+                        # Only if still open: an agent may have moved it since
+                        # this list was read
+                        submit_write(f"Closing ticket #{ticket['ticket_id']}", update_ticket_status, ticket["ticket_id"], "Closed",
+                                     False, "Open")
                         st.success(f"✅ Ticket #{ticket['ticket_id']} closed successfully!")
                         st.rerun()
 
-                elif details["status"] == "Closed":
+                elif ticket["status"].lower() == "closed":
                     if details["customer_review"] is None:
                         st.info("📝 This ticket is closed. Please share your feedback.")
                         with st.form(f"review_form_{ticket['ticket_id']}"):
@@ -235,15 +201,7 @@ with tab4:
                             Reopen = st.form_submit_button("Reopen")
 
                             if submit_review:
-                                conn = get_db_connection()
-                                cursor = conn.cursor()
-                                cursor.execute("""
-                                    UPDATE support_ticket
-                                    SET customer_review = %s, review_stars = %s
-                                    WHERE ticket_id = %s
-                                """, (review_text, review_stars, ticket["ticket_id"]))
-                                conn.commit()
-                                conn.close()
+                                save_review(ticket["ticket_id"], review_text, review_stars)
                                 st.success("⭐ Thank you for your feedback!")
                                 st.rerun()
                     else:
@@ -253,3 +211,5 @@ with tab4:
                             st.markdown(f"**Stars:** {'⭐' * stars}")
                         else:
                             st.markdown("**Stars:** No rating provided yet.")
+
+query_debug_panel()
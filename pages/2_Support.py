@@ -1,96 +1,174 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-from datetime import datetime
-from db import get_db_connection
+from datetime import date, timedelta
+import analytics
+import export
+import sla
+from charts import bar_chart, chart_png, grouped_bar_chart, line_chart, resolution_histogram
+from sections import (
+    begin_page,
+    invalidate_session_data,
+    pending_writes_status,
+    query_debug_panel,
+    comment_thread,
+    section_nav,
+    session_cached,
+    submit_write,
+    ticket_export_form,
+    ticket_filter_controls,
+)
 import streamlit as st
+import tickets as ticket_data
+import workqueue
+from dataservice import get_all_tickets, get_ticket_details, get_user_name, search_tickets
+from tickets import DEFAULT_SORT, PAGE_SIZES, page_cursor
 
 
-# Fetch all open and closed tickets
-def get_all_tickets():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT 
-            t.ticket_id,
-            c.company_name,
-            c.phone,
-            t.subject,
-            t.description,
-            t.priority,
-            t.status,
-            t.ticket_raised_on,
-            t.ticket_closed_on,
-            t.comments,
-            t.customer_review,
-            t.review_stars
-        FROM support_ticket t
-        JOIN customer_profile c ON t.customer_id = c.customer_id
-        ORDER BY t.ticket_raised_on DESC
-    """)
-    tickets = cursor.fetchall()
-    conn.close()
-    return tickets
+def update_ticket_status(ticket_id, new_status):
+    submit_write(f"Ticket #{ticket_id} status", ticket_data.update_ticket_status, ticket_id, new_status, True)
+    invalidate_session_data("claimed")
+    st.success(f"✅ Ticket #{ticket_id} updated to {new_status}")
 
 
+def add_ticket_comment(ticket_id, comment):
+    submit_write(f"Ticket #{ticket_id} comment", ticket_data.add_ticket_comment, ticket_id, comment,
+                 st.session_state.user_id)
+    invalidate_session_data("claimed")
 
 
-def update_ticket_status(ticket_id, new_status):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = "UPDATE support_ticket SET status = %s, ticket_closed_on = NOW() WHERE ticket_id = %s"
-    cursor.execute(query, (new_status, ticket_id))
-    conn.commit()
-    conn.close()
-    st.success(f"✅ Ticket #{ticket_id} updated to {new_status}")
+# Header, details toggle and (once opened) details and actions for one
+# ticket; archived tickets are shown without actions
+def render_ticket(ticket, read_only=False):
+    status = ticket["status"].lower()
+    if status == "open":
+        color_class = "status-open"
+    elif status == "in progress":
+        color_class = "status-inprogress"
+    else:
+        color_class = "status-closed"
+
+    
+    st.markdown(f"""
+        <div class="expander-header {color_class}">
+            🎫 Ticket #{ticket['ticket_id']} — {ticket['subject']} [{ticket['status'].upper()}]
+            {f"· 💬 {ticket['comment_count']}" if ticket.get("comment_count") else ""}
+        </div>
+    """, unsafe_allow_html=True)
+
+    is_open = st.session_state.open_ticket == ticket["ticket_id"]
+    if st.button("Hide Details" if is_open else "View Details", key=f"toggle_{ticket['ticket_id']}"):
+        st.session_state.open_ticket = None if is_open else ticket["ticket_id"]
+        st.rerun()
+
+    if not is_open:
+        return
+
+    details = get_ticket_details([ticket["ticket_id"]])[ticket["ticket_id"]]
+
+    with st.container(border=True):
+        st.markdown(f"**Customer:** {ticket['company_name']}")
+        st.markdown(f"**Phone:** {ticket['phone']}")
+        st.markdown(f"**Priority:** {ticket['priority']}")
+        if ticket.get("assigned_to"):
+            owner = "you" if ticket["assigned_to"] == st.session_state.user_id else f"agent #{ticket['assigned_to']}"
+            st.markdown(f"**Claimed by:** {owner}")
+        st.markdown(f"**Description:** {details['description']}")
+
+        if ticket['status'] == 'Closed':
+            st.markdown(f"**Customer Review:** {details['customer_review'] or 'No review yet'}")
+
+        st.markdown(f"**Created At:** {ticket['ticket_raised_on']}")
+        if ticket["ticket_closed_on"] and ticket['status'] == 'Closed':
+            st.markdown(f"**Closed At:** {ticket['ticket_closed_on']}")
+
+        st.markdown("**Comments:**")
+        comment_thread(ticket["ticket_id"])
+
+        if read_only:
+            st.info("🗄️ This ticket is archived.")
+            return
+
+        with st.form(f"comment_form_{ticket['ticket_id']}", clear_on_submit=True):
+            new_comment = st.text_area("💬 Add Comment")
+            submit_comment = st.form_submit_button("💾 Add Comment")
+
+            if submit_comment:
+                if not new_comment.strip():
+                    st.warning("Write a comment first.")
+                else:
+                    add_ticket_comment(ticket["ticket_id"], new_comment)
+                    st.success("✅ Comment added!")
+                    st.rerun()
+
+        
+        if ticket["status"].lower() in ["open", "in progress"]:
+            col3, col4 = st.columns([7, 2])
+            with col3:
+                if st.button(f"🛑 Close Ticket #{ticket['ticket_id']}", key=f"close_{ticket['ticket_id']}"):
+                    update_ticket_status(ticket["ticket_id"], "Closed")
+                    st.success(f"✅ Ticket #{ticket['ticket_id']} closed successfully!")
+                    st.rerun()
+
+            with col4:
+                if st.button("🚧 In Progress", key=f"in_progress_{ticket['ticket_id']}"):
+                    update_ticket_status(ticket["ticket_id"], "In Progress")
+                    st.success(f"✅ Ticket #{ticket['ticket_id']} status changed successfully!")
+                    st.rerun()
+        else:
+            st.info("✅ This ticket is already closed.")
+
+        if details["customer_review"]:
+            st.markdown("---")
+            st.markdown(f"**Customer Review:** {details['customer_review']}")
+            if ticket["review_stars"]:
+                stars = int(ticket["review_stars"])
+                st.markdown(f"**Rating:** {'⭐' * stars}")
+
+
+# Days covered by each SLA window, None for all time
+SLA_WINDOWS = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "All time": None}
+
+BULK_ACTIONS = ["🛑 Close", "🚧 Mark In Progress", "💬 Add Comment"]
+
+
+# Apply one action to several tickets of the current page in a single
+# transaction, then rerun once. Closed tickets are not offered.
+def render_bulk_actions(tickets):
+    if "bulk_result" in st.session_state:
+        st.success(st.session_state.pop("bulk_result"))
+
+    with st.expander("☑️ Bulk actions"):
+        labels = {t["ticket_id"]: f"#{t['ticket_id']} — {t['subject']} [{t['status']}]"
+                  for t in tickets if t["status"] != "Closed"}
+        if not labels:
+            st.info("No open tickets on this page.")
+            return
+        with st.form("bulk_actions_form"):
+            selected = st.multiselect("Tickets", list(labels), format_func=labels.get)
+            action = st.selectbox("Action", BULK_ACTIONS)
+            comment = st.text_area("Comment (for Add Comment)")
+            apply_bulk = st.form_submit_button("Apply to selected")
+
+            if apply_bulk:
+                if not selected:
+                    st.warning("Select at least one ticket.")
+                    return
+                if action == "💬 Add Comment" and not comment.strip():
+                    st.warning("Write a comment first.")
+                    return
+                if action == "💬 Add Comment":
+                    changed = ticket_data.bulk_add_comment(selected, comment, st.session_state.user_id)
+                else:
+                    new_status = "Closed" if action == "🛑 Close" else "In Progress"
+                    changed = ticket_data.bulk_update_status(selected, new_status, responded=True)
+                st.session_state.bulk_result = f"✅ Updated {changed} ticket(s)."
+                st.rerun()
 
 
-def update_ticket_comment(ticket_id, comment):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE support_ticket SET comments = %s WHERE ticket_id = %s",
-        (comment, ticket_id)
-    )
-    conn.commit()
-    conn.close()
-
-
-#  Analytics data
-def get_ticket_analytics():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
-       SELECT 
-    t.ticket_id,
-    t.subject,
-    t.priority,
-    t.status,
-    t.ticket_raised_on,
-    t.ticket_closed_on,
-    TIMESTAMPDIFF(HOUR, t.ticket_raised_on, t.ticket_closed_on) AS resolution_hours,
-    u.name AS name
-FROM support_ticket t
-INNER JOIN customer_profile c 
-    ON t.customer_id = c.customer_id
-INNER JOIN user_login u 
-    ON c.user_id = u.user_id;
-
-    """)
-    data = cursor.fetchall()
-    conn.close()
-    return pd.DataFrame(data)
-
-def get_user_name(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("select name from user_login where user_id = %s", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+# Stream the filtered tickets into a temporary file, then offer it for
+# download; the rows never sit in memory as a whole
+begin_page("support")
 
 user_id = st.session_state.user_id
-profile = get_user_name(user_id)
+profile = session_cached("user_name", get_user_name, user_id)
 user_name = profile["name"] if profile else "User"
 
 st.set_page_config(page_title="Support Dashboard", page_icon="🛠️")
@@ -104,8 +182,10 @@ with col2:
         st.session_state.role = None
         st.switch_page("login.py")
 
+pending_writes_status()
 
-tab1, tab2 = st.tabs(["📋 Ticket Management", "📊 Analytics"])
+
+section = section_nav(["📋 Ticket Management", "🎯 Work Queue", "📊 Analytics"], key="support_section")
 
 
 st.markdown("""
@@ -140,7 +220,7 @@ st.markdown("""
 
 
 
-with tab1:
+if section == "📋 Ticket Management":
     st.subheader("📋 All Customer Tickets")
 
 
@@ -161,164 +241,210 @@ with tab1:
     </style>
     """, unsafe_allow_html=True)
 
-    tickets = get_all_tickets()
-
-    if not tickets:
-        st.info("No tickets found in the system yet.")
+    if "ticket_page_size" not in st.session_state:
+        st.session_state.ticket_page_size = PAGE_SIZES[0]
+        st.session_state.ticket_cursors = [None]
+        st.session_state.open_ticket = None
+
+    page_size = st.selectbox("Tickets per page", PAGE_SIZES, key="ticket_page_size_select",
+                             index=PAGE_SIZES.index(st.session_state.ticket_page_size))
+    if page_size != st.session_state.ticket_page_size:
+        st.session_state.ticket_page_size = page_size
+        st.session_state.ticket_cursors = [None]
+
+    ticket_export_form()
+
+    archived = st.toggle("🗄️ Show archived tickets", key="show_archived")
+    filters, sort = ticket_filter_controls("ticket_filter", company_filter=True)
+    # Any change to what is listed starts again from the first page
+    view = (archived, filters, sort)
+    if view != st.session_state.get("ticket_view_last", (False, (), DEFAULT_SORT)):
+        st.session_state.ticket_view_last = view
+        st.session_state.ticket_cursors = [None]
+        st.session_state.ticket_search_page = 0
+
+    # Search covers the hot table only
+    search = st.text_input("🔍 Search tickets", key="ticket_search", disabled=archived,
+                           placeholder="Words from the subject, description or comments, or #ticket id")
+    if search != st.session_state.get("ticket_search_last"):
+        st.session_state.ticket_search_last = search
+        st.session_state.ticket_search_page = 0
+
+    if search.strip() and not archived:
+        search_page = st.session_state.ticket_search_page
+        tickets, has_more = search_tickets(search, page_size, search_page, filters)
+
+        if not tickets:
+            st.info("No tickets match your search.")
+        else:
+            render_bulk_actions(tickets)
+            for ticket in tickets:
+                render_ticket(ticket)
+
+        prev_col, page_col, next_col = st.columns([2, 5, 2])
+        with prev_col:
+            if st.button("⬅️ Previous", key="search_prev", disabled=search_page == 0):
+                st.session_state.ticket_search_page -= 1
+                st.rerun()
+        with page_col:
+            st.caption(f"Results page {search_page + 1}")
+        with next_col:
+            if st.button("Next ➡️", key="search_next", disabled=not has_more):
+                st.session_state.ticket_search_page += 1
+                st.rerun()
     else:
-        for ticket in tickets:
-           
-            status = ticket["status"].lower()
-            if status == "open":
-                color_class = "status-open"
-            elif status == "in progress":
-                color_class = "status-inprogress"
-            else:
-                color_class = "status-closed"
-
-            
-            st.markdown(f"""
-                <div class="expander-header {color_class}">
-                    🎫 Ticket #{ticket['ticket_id']} — {ticket['subject']} [{ticket['status'].upper()}]
-                </div>
-            """, unsafe_allow_html=True)
-
-            with st.expander("View Details"):
-                st.markdown(f"**Customer:** {ticket['company_name']}")
-                st.markdown(f"**Phone:** {ticket['phone']}")
-                st.markdown(f"**Priority:** {ticket['priority']}")
-                st.markdown(f"**Description:** {ticket['description']}")
-
-                if ticket['status'] == 'Closed':
-                    st.markdown(f"**Customer Review:** {ticket['customer_review'] or 'No review yet'}")
-
-                st.markdown(f"**Created At:** {ticket['ticket_raised_on']}")
-                if ticket["ticket_closed_on"] and ticket['status'] == 'Closed':
-                    st.markdown(f"**Closed At:** {ticket['ticket_closed_on']}")
-
-                
-                with st.form(f"comment_form_{ticket['ticket_id']}"):
-                    new_comment = st.text_area("💬 Add / Update Comment", value=ticket['comments'] or "")
-                    submit_comment = st.form_submit_button(
-                        "💾 Save Comment" if not ticket["comments"] else "💾 Update Comment"
-                    )
-
-                    if submit_comment:
-                        update_ticket_comment(ticket["ticket_id"], new_comment)
-                        st.success("✅ Comment updated successfully!")
-                        st.rerun()
-
-                
-                if ticket["status"].lower() in ["open", "in progress"]:
-                    col3, col4 = st.columns([7, 2])
-                    with col3:
-                        if st.button(f"🛑 Close Ticket #{ticket['ticket_id']}", key=f"close_{ticket['ticket_id']}"):
-                            update_ticket_status(ticket["ticket_id"], "Closed")
-                            st.success(f"✅ Ticket #{ticket['ticket_id']} closed successfully!")
-                            st.rerun()
-
-                    with col4:
-                        if st.button("🚧 In Progress", key=f"in_progress_{ticket['ticket_id']}"):
-                            update_ticket_status(ticket["ticket_id"], "In Progress")
-                            st.success(f"✅ Ticket #{ticket['ticket_id']} status changed successfully!")
-                            st.rerun()
-                else:
-                    st.info("✅ This ticket is already closed.")
+        cursors = st.session_state.ticket_cursors
+        tickets, has_more = get_all_tickets(page_size, cursors[-1], archived, filters, sort)
 
-                if ticket["customer_review"]:
-                    st.markdown("---")
-                    st.markdown(f"**Customer Review:** {ticket['customer_review']}")
-                    if ticket["review_stars"]:
-                        stars = int(ticket["review_stars"])
-                        st.markdown(f"**Rating:** {'⭐' * stars}")
-
-with tab2:
+        if not tickets:
+            if filters:
+                st.info("No tickets match these filters.")
+            else:
+                st.info("No archived tickets." if archived else "No tickets found in the system yet.")
+        else:
+            if not archived:
+                render_bulk_actions(tickets)
+            for ticket in tickets:
+                render_ticket(ticket, read_only=archived)
+
+        prev_col, page_col, next_col = st.columns([2, 5, 2])
+        with prev_col:
+            if st.button("⬅️ Previous", key="tickets_prev", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with page_col:
+            st.caption(f"Page {len(cursors)}")
+        with next_col:
+            if st.button("Next ➡️", key="tickets_next", disabled=not has_more):
+                cursors.append(page_cursor(tickets[-1], sort))
+                st.rerun()
+
+elif section == "🎯 Work Queue":
+    st.subheader("🎯 My Work Queue")
+    st.session_state.setdefault("open_ticket", None)
+
+    depth = session_cached("queue_depth", workqueue.queue_depth, ttl=10)
+    st.caption("Waiting: " + ", ".join(f"{priority} {count}" for priority, count in depth.items())
+               + f" · unstarted claims return to the queue after {workqueue.CLAIM_TIMEOUT_MINUTES} min")
+
+    if st.button("▶️ Claim next ticket", key="claim_next"):
+        ticket_id = workqueue.claim_next_ticket(user_id)
+        invalidate_session_data("claimed", "queue_depth")
+        if ticket_id is None:
+            st.session_state.claim_result = "empty"
+        else:
+            st.session_state.open_ticket = ticket_id
+        st.rerun()
+    if st.session_state.pop("claim_result", None) == "empty":
+        st.info("🎉 The queue is empty.")
+
+    claimed = session_cached("claimed", workqueue.get_claimed_tickets, user_id, ttl=30)
+    if not claimed:
+        st.info("You have no claimed tickets.")
+    for ticket in claimed:
+        render_ticket(ticket)
+        if st.button("↩️ Release", key=f"release_{ticket['ticket_id']}"):
+            workqueue.release_ticket(ticket["ticket_id"], user_id)
+            invalidate_session_data("claimed", "queue_depth")
+            st.rerun()
+
+elif section == "📊 Analytics":
     st.subheader("📊 Support Analytics Dashboard")
 
-    df_analytics = get_ticket_analytics()
-
-    if df_analytics.empty:
+    cache = analytics.get_analytics_cache()
+    if st.button("🔄 Rebuild Analytics", key="rebuild_analytics"):
+        cache.refresh(full=True)
+    else:
+        cache.refresh()
+    try:
+        analytics.get_topic_index().refresh()
+    except Exception as e:
+        st.warning(f"⚠️ Topic index could not be refreshed: {e}")
+    aggregates = cache.snapshot()
+    priority_status = aggregates["priority_status"]
+
+    if priority_status.empty:
         st.info("No data available yet for analytics.")
     else:
         st.markdown("### ⚡ Service Efficiency (Average Resolution Time in Hours)")
-        df_closed = df_analytics[df_analytics["status"].str.lower() == "closed"]
+        resolution_counts = aggregates["resolution"]
 
-        if not df_closed.empty:
-            avg_resolution = df_closed["resolution_hours"].mean()
+        if not resolution_counts.empty:
+            avg_resolution = analytics.average_resolution_hours(resolution_counts)
             st.metric(label="Average Resolution Time", value=f"{avg_resolution:.1f} hours")
 
-            plt.figure(figsize=(7, 4))
-            plt.hist(df_closed["resolution_hours"].dropna(), bins=10)
-            plt.xlabel("Resolution Time (hours)")
-            plt.ylabel("Number of Tickets")
-            plt.title("Distribution of Ticket Resolution Times")
-            st.pyplot(plt)
+            st.image(chart_png(resolution_histogram, resolution_counts, figsize=(7, 4)))
         else:
             st.info("No closed tickets yet to calculate resolution times.")
 
+        st.markdown("### ⏱️ SLA Percentiles")
+        window = st.selectbox("Window", list(SLA_WINDOWS), key="sla_window")
+        days = SLA_WINDOWS[window]
+        since = date.today() - timedelta(days=days - 1) if days else None
+        percentiles = session_cached("sla_percentiles", sla.sla_percentiles, since, ttl=60)
+        if percentiles.empty:
+            st.info("No resolved or answered tickets in this window.")
+        else:
+            st.dataframe(percentiles, use_container_width=True, hide_index=True)
+
        
         st.markdown("### 🧭 Support Load Monitoring (By Priority)")
-        load_data = df_analytics.groupby("priority").size().reset_index(name="Count")
+        load_data = priority_status.groupby("priority", as_index=False)["Count"].sum()
 
-        plt.figure(figsize=(6, 4))
-        plt.bar(load_data["priority"], load_data["Count"])
-        plt.xlabel("Priority")
-        plt.ylabel("Number of Tickets")
-        plt.title("Ticket Load by Priority")
-        st.pyplot(plt)
+        st.image(chart_png(bar_chart, load_data, title="Ticket Load by Priority",
+                           xlabel="Priority", ylabel="Number of Tickets"))
 
        
         st.markdown("### 📈 Ticket Status Overview")
-        status_counts = df_analytics["status"].value_counts().reset_index()
+        status_counts = (
+            priority_status.groupby("status", as_index=False)["Count"].sum()
+            .sort_values("Count", ascending=False)
+        )
         status_counts.columns = ["Status", "Count"]
 
-        plt.figure(figsize=(6, 4))
-        plt.bar(status_counts["Status"], status_counts["Count"], color=["#FFA500", "#2196F3", "#4CAF50"])
-        plt.xlabel("Ticket Status")
-        plt.ylabel("Number of Tickets")
-        plt.title("Open vs In Progress vs Closed Tickets")
-        st.pyplot(plt)
+        st.image(chart_png(bar_chart, status_counts, title="Open vs In Progress vs Closed Tickets",
+                           xlabel="Ticket Status", ylabel="Number of Tickets",
+                           colors=("#FFA500", "#2196F3", "#4CAF50")))
 
    
         st.markdown("### 🎯 Ticket Distribution by Priority & Status")
-        pivot_priority_status = (
-            df_analytics.groupby(["priority", "status"])
-            .size()
-            .reset_index(name="Count")
-        )
-
-        pivot_table = pivot_priority_status.pivot(index="priority", columns="status", values="Count").fillna(0)
+        pivot_table = priority_status.pivot(index="priority", columns="status", values="Count").fillna(0)
         st.dataframe(pivot_table, use_container_width=True)
 
-        plt.figure(figsize=(7, 4))
-        pivot_priority_status.pivot(index="priority", columns="status", values="Count").plot(kind="bar", figsize=(7, 4))
-        plt.title("Priority vs Status Overview")
-        plt.xlabel("Priority")
-        plt.ylabel("Ticket Count")
-        plt.xticks(rotation=0)
-        st.pyplot(plt)
+        st.image(chart_png(grouped_bar_chart, pivot_table, figsize=(7, 4), title="Priority vs Status Overview",
+                           xlabel="Priority", ylabel="Ticket Count", legend_title="status"))
 
         
+        st.markdown("### 📅 Ticket Volume Over Time")
+        volume_window = st.selectbox("Window", list(SLA_WINDOWS), index=len(SLA_WINDOWS) - 1,
+                                     key="volume_window")
+        days = SLA_WINDOWS[volume_window]
+        since = date.today() - timedelta(days=days - 1) if days else None
+        period, volume = session_cached("ticket_volume", analytics.get_ticket_volume, since, ttl=60)
+        if volume.empty:
+            st.info("No tickets raised in this window.")
+        else:
+            st.image(chart_png(line_chart, volume, figsize=(8, 4), title=f"Tickets Raised per {period}",
+                               xlabel=period, ylabel="Number of Tickets", legend_title="Priority"))
+
         st.markdown("### 👥 Tickets by User and Status")
-        user_status = (
-            df_analytics.groupby(["name", "status"])
-            .size()
-            .reset_index(name="Count")
-        )
+        user_status = aggregates["user_status"]
+        st.caption(f"Top {analytics.TOP_USERS} of {aggregates['user_total']} customers by ticket count; "
+                   f"the rest are grouped under \"{analytics.OTHER}\".")
 
-        st.dataframe(user_status, use_container_width=True)
+        user_pivot = user_status.pivot(index="name", columns="status", values="Count").fillna(0)
+        # Busiest customers first, "Other" last
+        order = user_pivot.sum(axis=1).drop(analytics.OTHER, errors="ignore").sort_values(ascending=False).index
+        rest = [analytics.OTHER] if analytics.OTHER in user_pivot.index else []
+        user_pivot = user_pivot.reindex(list(order) + rest)
+        st.dataframe(user_pivot, use_container_width=True)
 
-        plt.figure(figsize=(8, 4))
-        for status in user_status["status"].unique():
-            subset = user_status[user_status["status"] == status]
-            plt.bar(subset["name"], subset["Count"], label=status)
-        plt.title("Ticket Count by User and Status")
-        plt.xlabel("Customer / User")
-        plt.ylabel("Number of Tickets")
-        plt.legend(title="Status")
-        plt.xticks(rotation=45, ha="right")
-        st.pyplot(plt)
+        st.image(chart_png(grouped_bar_chart, user_pivot, figsize=(8, 4), title="Ticket Count by User and Status",
+                           xlabel="Customer / User", ylabel="Number of Tickets", legend_title="Status",
+                           rotation=45))
 
         st.markdown("### 💬 Most Common Query Topics")
-        top_subjects = df_analytics["subject"].value_counts().head(5)
+        top_subjects = aggregates["top_subjects"]
         st.bar_chart(top_subjects)
+
+query_debug_panel()
@@ -0,0 +1,247 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Records every statement run through a pooled connection's cursors:
+# normalised SQL, duration, rows and the calling function. Entries are
+# grouped per rerun (begin_rerun() at the top of each page) and per
+# session, aggregated per normalised statement, kept in a slow-query log
+# and optionally appended to a JSONL file for offline analysis.
+
+ENABLED = os.environ.get("CQMS_QUERY_STATS", "1") != "0"
+SLOW_MS = float(os.environ.get("CQMS_SLOW_QUERY_MS", "100"))
+JSONL_PATH = os.environ.get("CQMS_QUERY_LOG")
+MAX_SESSIONS = 200
+MAX_SLOW = 200
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}
+_sessions = OrderedDict()
+_slow = deque(maxlen=MAX_SLOW)
+
+_SKIP_FILES = {os.path.abspath(__file__), os.path.abspath(os.path.join(os.path.dirname(__file__), "db.py"))}
+# Modules mark their shared plumbing, which runs every helper's SQL, with
+# a module-level `__querylog_skip__` set of function names; the helper
+# calling it is reported instead
+SKIP_MARKER = "__querylog_skip__"
+
+
+def normalize(sql):
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    sql = re.sub(r"%s", "?", sql)
+    sql = re.sub(r"\s+", " ", sql).strip()
+    return re.sub(r"IN \((\?, )*\?\)", "IN (...)", sql, flags=re.IGNORECASE)
+
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        basename = os.path.basename(filename)
+        if (filename not in _SKIP_FILES and "mysql" not in filename
+                and frame.f_code.co_name not in frame.f_globals.get(SKIP_MARKER, ())):
+            return f"{basename}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryEntry:
+    __slots__ = ("sql", "caller", "started", "duration_ms", "rows", "session", "rerun")
+
+    def __init__(self, sql, caller, session, rerun):
+        self.sql = sql
+        self.caller = caller
+        self.started = time.time()
+        self.duration_ms = 0.0
+        self.rows = 0
+        self.session = session
+        self.rerun = rerun
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Rerun:
+    def __init__(self, session, page):
+        self.session = session
+        self.page = page
+        self.started = time.time()
+        self.entries = []
+
+    def summary(self):
+        return {
+            "page": self.page,
+            "queries": len(self.entries),
+            "total_ms": sum(e.duration_ms for e in self.entries),
+            "rows": sum(e.rows for e in self.entries),
+        }
+
+
+def _new_totals():
+    return {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "callers": set()}
+
+
+# Start collecting statements for one rerun of `page` in this thread
+def begin_rerun(session, page):
+    rerun = Rerun(session, page)
+    _local.rerun = rerun
+    return rerun
+
+
+def current_rerun():
+    return getattr(_local, "rerun", None)
+
+
+# Called by the instrumented cursor
+def start(sql):
+    rerun = current_rerun()
+    return QueryEntry(
+        normalize(sql), _caller(),
+        rerun.session if rerun else None,
+        id(rerun) if rerun else None,
+    )
+
+
+def _add(bucket, entry):
+    bucket["count"] += 1
+    bucket["total_ms"] += entry.duration_ms
+    bucket["max_ms"] = max(bucket["max_ms"], entry.duration_ms)
+    bucket["rows"] += entry.rows
+    bucket["callers"].add(entry.caller)
+
+
+def finish(entry):
+    rerun = current_rerun()
+    if rerun is not None:
+        rerun.entries.append(entry)
+    with _lock:
+        _add(_totals.setdefault(entry.sql, _new_totals()), entry)
+        if entry.session is not None:
+            session = _sessions.setdefault(entry.session, {})
+            _sessions.move_to_end(entry.session)
+            while len(_sessions) > MAX_SESSIONS:
+                _sessions.popitem(last=False)
+            _add(session.setdefault(entry.sql, _new_totals()), entry)
+        if entry.duration_ms >= SLOW_MS:
+            _slow.append(entry)
+    if JSONL_PATH:
+        _append_jsonl(JSONL_PATH, [entry.as_dict()])
+
+
+def _append_jsonl(path, records):
+    with _lock:
+        with open(path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def _rows_of(stats):
+    return sorted(
+        ({"sql": sql, **dict(s, callers=sorted(s["callers"]))} for sql, s in stats.items()),
+        key=lambda r: r["total_ms"], reverse=True,
+    )
+
+
+# Aggregated counters per normalised statement, process-wide or for one session
+def query_stats(session=None):
+    with _lock:
+        stats = _totals if session is None else _sessions.get(session, {})
+        return _rows_of(stats)
+
+
+def slow_queries():
+    with _lock:
+        return [e.as_dict() for e in reversed(_slow)]
+
+
+# Write the aggregated counters and the slow-query log to a JSONL file
+def _dump_records():
+    records = [dict(row, kind="stats") for row in query_stats()]
+    records += [dict(entry, kind="slow") for entry in slow_queries()]
+    return records
+
+
+def dump_jsonl(path):
+    _append_jsonl(path, _dump_records())
+
+
+# The same records as dump_jsonl() writes, as one JSONL string
+def stats_jsonl():
+    return "".join(json.dumps(record, default=str) + "\n" for record in _dump_records())
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+        _sessions.clear()
+        _slow.clear()
+
+
+# Wraps a mysql-connector cursor, timing execute and fetch calls
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._entry = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _close_entry(self):
+        if self._entry is not None:
+            finish(self._entry)
+            self._entry = None
+
+    def _run(self, method, operation, *args, **kwargs):
+        self._close_entry()
+        entry = start(operation)
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            entry.duration_ms = (time.perf_counter() - started) * 1000
+            if self._cursor.with_rows:
+                self._entry = entry
+            else:
+                entry.rows = max(self._cursor.rowcount, 0)
+                finish(entry)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._run(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._run(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self._entry is not None:
+            self._entry.duration_ms += (time.perf_counter() - started) * 1000
+            if isinstance(result, list):
+                self._entry.rows += len(result)
+            elif result is not None:
+                self._entry.rows += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        result = self._fetch(self._cursor.fetchall)
+        self._close_entry()
+        return result
+
+    def close(self):
+        self._close_entry()
+        return self._cursor.close()
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Process-wide cache for read helper results, shared by every session.
+# Each entry is tagged with the generation of every entity it was read
+# from ("tickets", ("user", user_id), ...). Write helpers bump the
+# entities they changed once their transaction has committed, which makes
+# all entries read before the bump stale at once, without tracking which
+# keys a write touched. The generations are taken before the query runs,
+# so a read racing a commit is tagged with the old generation and dropped.
+#
+# Bumps are only seen in this process: changes made elsewhere (archive.py,
+# another app server, the data service's own clients) show up after TTL
+# seconds at the latest. The least recently used entries are evicted beyond
+# MAX_ENTRIES. CQMS_RESULT_CACHE=0 turns the cache off.
+
+ENABLED = os.environ.get("CQMS_RESULT_CACHE", "1") != "0"
+TTL = float(os.environ.get("CQMS_RESULT_CACHE_TTL", "30"))
+MAX_ENTRIES = int(os.environ.get("CQMS_RESULT_CACHE_SIZE", "2000"))
+
+
+# Every caller gets its own row dicts, as with a fresh query
+def _copy(value):
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    return value
+
+
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = Counter()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def _current(self, entities):
+        return tuple(self._generations[entity] for entity in entities)
+
+    # Cached result for `key`, or load() run and stored; `entities` are what
+    # the result was read from
+    def get(self, key, entities, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, generations, value = entry
+                if generations != self._current(entities):
+                    self._stats["stale"] += 1
+                    del self._entries[key]
+                elif time.monotonic() - stored_at > self.ttl:
+                    self._stats["expired"] += 1
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return _copy(value)
+            self._stats["misses"] += 1
+            generations = self._current(entities)
+
+        value = load()
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), generations, _copy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+
+    # Mark everything read from `entities` so far as stale
+    def bump(self, *entities):
+        with self._lock:
+            for entity in entities:
+                self._generations[entity] += 1
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {name: self._stats[name] for name in
+                     ("hits", "misses", "stale", "expired", "evictions", "invalidations")}
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+# load() through the shared cache, or straight through when it is off
+def cached(key, entities, load):
+    if not ENABLED:
+        return load()
+    return get_result_cache().get(key, entities, load)
+
+
+# Called by the write helpers after their commit
+def invalidate(*entities):
+    if ENABLED:
+        get_result_cache().bump(*entities)
@@ -0,0 +1,647 @@
+import argparse
+import sys
+import threading
+from datetime import date
+
+from db import db_connection
+
+# Versioned schema for CQMS. Each migration is applied once, in order, and
+# recorded in schema_version; steps are SQL strings or callables taking a
+# cursor. `python schema.py migrate` applies pending migrations (run it on
+# each deploy, before starting the app; the pages only check the version),
+# `python schema.py rebuild-rollups` recomputes the rollups and
+# `python schema.py check` EXPLAINs every query the pages run.
+
+BASE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS user_login (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        password_hash CHAR(64) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'active'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_profile (
+        customer_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        company_name VARCHAR(255),
+        phone VARCHAR(30),
+        address TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS support_ticket (
+        ticket_id INT AUTO_INCREMENT PRIMARY KEY,
+        customer_id INT NOT NULL,
+        subject VARCHAR(255) NOT NULL,
+        description TEXT,
+        priority VARCHAR(20) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        ticket_raised_on DATETIME NOT NULL,
+        ticket_closed_on DATETIME NULL,
+        comments TEXT,
+        customer_review TEXT,
+        review_stars TINYINT NULL
+    )
+    """,
+]
+
+# (table, index name, columns, unique)
+INDEXES = [
+    # Login: WHERE email = ? AND role = ? AND status = ? (password_hash is
+    # then checked on the single matching row)
+    ("user_login", "idx_login_email_role_status", "email, role, status", False),
+    ("customer_profile", "idx_profile_user", "user_id", True),
+    # Customer ticket list: WHERE customer_id = ? ORDER BY ticket_raised_on DESC
+    ("support_ticket", "idx_ticket_customer_raised", "customer_id, ticket_raised_on", False),
+    # Support list keyset pagination on (ticket_raised_on, ticket_id)
+    ("support_ticket", "idx_ticket_raised", "ticket_raised_on, ticket_id", False),
+    # Per-customer status counts, covered by the index
+    ("support_ticket", "idx_ticket_customer_status", "customer_id, status", False),
+    # Open-ticket lookups for the analytics cache
+    ("support_ticket", "idx_ticket_status", "status, priority", False),
+]
+
+# Per-day / priority / status ticket counters, maintained on every ticket
+# insert and status change so the Analytics tab never scans support_ticket.
+DAILY_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS ticket_daily_rollup (
+        day DATE NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        ticket_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, priority, status)
+    )
+"""
+
+# Closed-ticket counts per priority and whole resolution hour; enough to
+# derive the average and the histogram without touching ticket rows.
+RESOLUTION_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS ticket_resolution_rollup (
+        priority VARCHAR(20) NOT NULL,
+        resolution_hours INT NOT NULL,
+        ticket_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (priority, resolution_hours)
+    )
+"""
+
+# Closed tickets older than CQMS_ARCHIVE_AFTER_DAYS are moved here by
+# archive.py, keeping support_ticket small. Same columns and indexes, so
+# both tiers can be read with one UNION ALL. Columns added to
+# support_ticket later must be added to the archive too.
+ARCHIVE_TABLE = "support_ticket_archive"
+ALL_TICKETS = f"(SELECT * FROM support_ticket UNION ALL SELECT * FROM {ARCHIVE_TABLE})"
+
+# Recomputes both rollups from {tickets}: every ticket, hot and archived
+ROLLUP_REBUILD = [
+    "DELETE FROM ticket_daily_rollup",
+    "DELETE FROM ticket_resolution_rollup",
+    """
+    INSERT INTO ticket_daily_rollup (day, priority, status, ticket_count)
+    SELECT DATE(ticket_raised_on), priority, status, COUNT(*)
+    FROM {tickets} t
+    GROUP BY DATE(ticket_raised_on), priority, status
+    """,
+    """
+    INSERT INTO ticket_resolution_rollup (priority, resolution_hours, ticket_count)
+    SELECT priority, TIMESTAMPDIFF(HOUR, ticket_raised_on, ticket_closed_on), COUNT(*)
+    FROM {tickets} t
+    WHERE status = 'Closed' AND ticket_closed_on IS NOT NULL
+    GROUP BY priority, TIMESTAMPDIFF(HOUR, ticket_raised_on, ticket_closed_on)
+    """,
+]
+
+
+# Per-day quantile sketches (see sla.py) of resolution and first-response
+# minutes. A sample of m minutes is counted in bucket 0 below one minute,
+# else in bucket ceil(log_gamma(m)) + 1, so any quantile read back is
+# within SLA_ALPHA relative error. Kept in step by the status and comment
+# write helpers like the rollups above.
+SLA_ALPHA = 0.01
+SLA_GAMMA = (1 + SLA_ALPHA) / (1 - SLA_ALPHA)
+
+SLA_SKETCH_DDL = """
+    CREATE TABLE IF NOT EXISTS ticket_sla_sketch (
+        metric VARCHAR(20) NOT NULL,
+        day DATE NOT NULL,
+        priority VARCHAR(20) NOT NULL,
+        bucket INT NOT NULL,
+        ticket_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (metric, day, priority, bucket)
+    )
+"""
+
+
+def _sla_bucket_sql(start, end):
+    minutes = f"TIMESTAMPDIFF(SECOND, {start}, {end}) / 60"
+    return f"CASE WHEN {minutes} < 1 THEN 0 ELSE CEIL(LOG({SLA_GAMMA!r}, {minutes})) + 1 END"
+
+
+# Recomputes the SLA sketches from {tickets}
+SLA_REBUILD = [
+    "DELETE FROM ticket_sla_sketch",
+    f"""
+    INSERT INTO ticket_sla_sketch (metric, day, priority, bucket, ticket_count)
+    SELECT 'resolution', DATE(ticket_closed_on), priority,
+           {_sla_bucket_sql("ticket_raised_on", "ticket_closed_on")} AS bucket, COUNT(*)
+    FROM {{tickets}} t
+    WHERE status = 'Closed' AND ticket_closed_on IS NOT NULL
+    GROUP BY DATE(ticket_closed_on), priority, bucket
+    """,
+    f"""
+    INSERT INTO ticket_sla_sketch (metric, day, priority, bucket, ticket_count)
+    SELECT 'first_response', DATE(first_response_on), priority,
+           {_sla_bucket_sql("ticket_raised_on", "first_response_on")} AS bucket, COUNT(*)
+    FROM {{tickets}} t
+    WHERE first_response_on IS NOT NULL
+    GROUP BY DATE(first_response_on), priority, bucket
+    """,
+]
+
+
+# Near-duplicate subject clusters (see topics.py) and which topic each
+# ticket was assigned to; ticket_count is kept in step with the assignments
+TOPIC_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS ticket_topic (
+        topic_id INT AUTO_INCREMENT PRIMARY KEY,
+        label VARCHAR(255) NOT NULL,
+        signature VARBINARY(512) NOT NULL,
+        ticket_count INT NOT NULL DEFAULT 0,
+        INDEX idx_topic_count (ticket_count)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ticket_topic_assignment (
+        ticket_id INT PRIMARY KEY,
+        topic_id INT NOT NULL,
+        INDEX idx_assignment_topic (topic_id)
+    )
+    """,
+]
+
+
+# Agent comments, one row each, appended and never rewritten. Tickets
+# carry comment_count so lists need not touch this table.
+COMMENT_DDL = """
+    CREATE TABLE IF NOT EXISTS ticket_comment (
+        comment_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        ticket_id INT NOT NULL,
+        author_id INT NULL,
+        body TEXT NOT NULL,
+        created_at DATETIME(6) NOT NULL,
+        INDEX idx_comment_ticket (ticket_id, created_at)
+    )
+"""
+
+
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def add_index(cursor, table, index, columns, unique=False):
+    if not index_exists(cursor, table, index):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {index} ({columns})")
+
+
+def add_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# Rollup rebuild statements; the archive only exists from migration 7 on
+# and the SLA sketches from migration 8
+def rollup_rebuild(cursor):
+    tickets = ALL_TICKETS if table_exists(cursor, ARCHIVE_TABLE) else "support_ticket"
+    statements = ROLLUP_REBUILD
+    if table_exists(cursor, "ticket_sla_sketch"):
+        statements = statements + SLA_REBUILD
+    return [statement.format(tickets=tickets) for statement in statements]
+
+
+def _add_indexes(cursor):
+    for table, index, columns, unique in INDEXES:
+        add_index(cursor, table, index, columns, unique)
+
+
+def _add_rollups(cursor):
+    backfill = not (table_exists(cursor, "ticket_daily_rollup")
+                    and table_exists(cursor, "ticket_resolution_rollup"))
+    cursor.execute(DAILY_ROLLUP_DDL)
+    cursor.execute(RESOLUTION_ROLLUP_DDL)
+    if backfill:
+        for statement in rollup_rebuild(cursor):
+            cursor.execute(statement)
+
+
+def _add_status_watermark(cursor):
+    # Stamped on every status change; the analytics cache uses it as a
+    # watermark to find tickets that changed since its last refresh.
+    add_column(cursor, "support_ticket", "status_changed_on", "DATETIME(6) NULL")
+    add_index(cursor, "support_ticket", "idx_ticket_status_changed", "status_changed_on")
+
+
+def _add_fulltext(cursor):
+    # Ticket search over subject, description and comments
+    if not index_exists(cursor, "support_ticket", "ft_ticket_text"):
+        cursor.execute(
+            "ALTER TABLE support_ticket ADD FULLTEXT INDEX ft_ticket_text (subject, description, comments)"
+        )
+
+
+def _drop_subject_index(cursor):
+    # Topic counts come from the topic index now, nothing groups by subject
+    if index_exists(cursor, "support_ticket", "idx_ticket_subject"):
+        cursor.execute("ALTER TABLE support_ticket DROP INDEX idx_ticket_subject")
+
+
+def _add_archive(cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} LIKE support_ticket")
+    # Lets archive.py find closed tickets past the cutoff without a scan
+    add_index(cursor, "support_ticket", "idx_ticket_status_closed", "status, ticket_closed_on")
+
+
+def _add_filter_indexes(cursor):
+    # Filtered / re-sorted ticket lists: WHERE status = ? or priority = ?
+    # ORDER BY ticket_raised_on, and the "recently closed" order
+    for table in ("support_ticket", ARCHIVE_TABLE):
+        add_index(cursor, table, "idx_ticket_status_raised", "status, ticket_raised_on, ticket_id")
+        add_index(cursor, table, "idx_ticket_priority_raised", "priority, ticket_raised_on, ticket_id")
+        add_index(cursor, table, "idx_ticket_closed", "ticket_closed_on, ticket_id")
+
+
+def _add_work_queue(cursor):
+    # Agent claims (workqueue.py). Both tables keep the same columns in
+    # the same order, as archiving copies rows with SELECT *.
+    for table in ("support_ticket", ARCHIVE_TABLE):
+        add_column(cursor, table, "assigned_to", "INT NULL")
+        add_column(cursor, table, "claimed_at", "DATETIME NULL")
+    # Claim: WHERE status = ? AND priority = ? AND assigned_to IS NULL
+    # ORDER BY ticket_raised_on, ticket_id
+    add_index(cursor, "support_ticket", "idx_ticket_queue",
+              "status, priority, assigned_to, ticket_raised_on, ticket_id")
+    add_index(cursor, "support_ticket", "idx_ticket_assignee", "assigned_to, status")
+    add_index(cursor, "support_ticket", "idx_ticket_claimed", "claimed_at")
+
+
+def _add_comment_thread(cursor):
+    cursor.execute(COMMENT_DDL)
+    for table in ("support_ticket", ARCHIVE_TABLE):
+        add_column(cursor, table, "comment_count", "INT NOT NULL DEFAULT 0")
+        if not column_exists(cursor, table, "comments"):
+            continue
+        # The old single comment becomes the first of the thread
+        cursor.execute(f"""
+            INSERT INTO ticket_comment (ticket_id, author_id, body, created_at)
+            SELECT ticket_id, NULL, comments,
+                   COALESCE(first_response_on, status_changed_on, ticket_raised_on)
+            FROM {table}
+            WHERE comments IS NOT NULL AND comments <> ''
+        """)
+        cursor.execute(f"""
+            UPDATE {table} SET comment_count = 1
+            WHERE comments IS NOT NULL AND comments <> ''
+        """)
+        if index_exists(cursor, table, "ft_ticket_text"):
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX ft_ticket_text")
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN comments")
+    # Search covers the ticket text and the comments, one index each
+    if not index_exists(cursor, "support_ticket", "ft_ticket_text"):
+        cursor.execute("ALTER TABLE support_ticket ADD FULLTEXT INDEX ft_ticket_text (subject, description)")
+    if not index_exists(cursor, "ticket_comment", "ft_comment_body"):
+        cursor.execute("ALTER TABLE ticket_comment ADD FULLTEXT INDEX ft_comment_body (body)")
+
+
+def _add_sla_sketch(cursor):
+    # Set by the first status change away from open or the first comment.
+    # Existing tickets get their last status change as an approximation.
+    for table in ("support_ticket", ARCHIVE_TABLE):
+        add_column(cursor, table, "first_response_on", "DATETIME NULL")
+        cursor.execute(f"""
+            UPDATE {table}
+            SET first_response_on = COALESCE(status_changed_on, ticket_closed_on)
+            WHERE first_response_on IS NULL AND LOWER(status) <> 'open'
+        """)
+    backfill = not table_exists(cursor, "ticket_sla_sketch")
+    cursor.execute(SLA_SKETCH_DDL)
+    if backfill:
+        for statement in SLA_REBUILD:
+            cursor.execute(statement.format(tickets=ALL_TICKETS))
+
+
+MIGRATIONS = [
+    (1, "base tables", BASE_TABLES),
+    (2, "indexes for page queries", [_add_indexes]),
+    (3, "analytics rollup tables", [_add_rollups]),
+    (4, "status change watermark", [_add_status_watermark]),
+    (5, "full-text ticket search", [_add_fulltext]),
+    (6, "ticket topic index", TOPIC_DDL + [_drop_subject_index]),
+    (7, "closed ticket archive", [_add_archive]),
+    (8, "SLA quantile sketches", [_add_sla_sketch]),
+    (9, "ticket list filter indexes", [_add_filter_indexes]),
+    (10, "agent work queue", [_add_work_queue]),
+    (11, "comment threads", [_add_comment_thread]),
+]
+
+
+def current_version(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_on DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return applied_version(cursor)
+
+
+# The applied version, without creating schema_version; 0 before the
+# first migration
+def applied_version(cursor):
+    if not table_exists(cursor, "schema_version"):
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+# Only one process migrates at a time (MySQL GET_LOCK); a second
+# `migrate` waits up to this many seconds and then finds nothing pending
+MIGRATE_LOCK = "cqms_schema_migrate"
+MIGRATE_LOCK_TIMEOUT = 600
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+# Apply every pending migration; returns the versions applied. A deploy
+# step (`python schema.py migrate`), never run by the pages.
+def migrate(verbose=False):
+    applied = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATE_LOCK, MIGRATE_LOCK_TIMEOUT))
+        if not cursor.fetchone()[0]:
+            raise RuntimeError("Another process is still migrating the schema")
+        try:
+            # Read the version only once the lock is held: whoever held
+            # it before may have applied what we were about to
+            conn.commit()
+            version = current_version(cursor)
+            for number, description, steps in MIGRATIONS:
+                if number <= version:
+                    continue
+                if verbose:
+                    print(f"Applying {number}: {description}")
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (number, description)
+                )
+                conn.commit()
+                applied.append(number)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATE_LOCK,))
+            cursor.fetchone()
+    return applied
+
+
+_ready = False
+_ready_lock = threading.Lock()
+
+
+# Check, once per process, that every migration has been applied before
+# the first query that depends on them. Raises SchemaOutdated otherwise;
+# an outdated result is not remembered, so the process recovers as soon
+# as `python schema.py migrate` has run.
+def ensure_schema():
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        with db_connection() as conn:
+            version = applied_version(conn.cursor())
+        latest = MIGRATIONS[-1][0]
+        if version < latest:
+            raise SchemaOutdated(
+                f"Database schema is at version {version} of {latest}; "
+                "run `python schema.py migrate`"
+            )
+        _ready = True
+
+
+# Recompute the daily, resolution and SLA rollups from all tickets, e.g.
+# after a manual data fix; `python schema.py rebuild-rollups`
+def rebuild_rollups():
+    ensure_schema()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for statement in rollup_rebuild(cursor):
+            cursor.execute(statement)
+        conn.commit()
+
+
+# Statements the pages issue that have no query builder or SQL constant
+# to take them from, with representative parameters. Keep in sync with
+# their helpers.
+OTHER_QUERIES = {
+    "ticket_volume_range": ("SELECT MIN(day), MAX(day) FROM ticket_daily_rollup WHERE day >= %s", ("2000-01-01",)),
+    "ticket_volume_weekly": ("""
+        SELECT day - INTERVAL WEEKDAY(day) DAY AS period, priority, SUM(ticket_count) AS Count
+        FROM ticket_daily_rollup
+        WHERE day >= %s
+        GROUP BY period, priority
+    """, ("2000-01-01",)),
+    "release_expired_claims": ("""
+        SELECT ticket_id FROM support_ticket
+        WHERE claimed_at < %s AND status = 'Open'
+    """, ("2000-01-01",)),
+    "archive_candidates": ("""
+        SELECT ticket_id FROM support_ticket
+        WHERE status = 'Closed' AND ticket_closed_on < %s
+        ORDER BY ticket_closed_on LIMIT %s
+        FOR UPDATE
+    """, ("2000-01-01", 1000)),
+    "sla_sketch": ("""
+        SELECT priority, bucket, SUM(ticket_count)
+        FROM ticket_sla_sketch
+        WHERE metric = %s AND day >= %s AND day < %s
+        GROUP BY priority, bucket
+    """, ("resolution", "2000-01-01", "2100-01-01")),
+    "topic_assigned_watermark": ("SELECT COALESCE(MAX(ticket_id), 0) FROM ticket_topic_assignment", ()),
+    "topic_state": ("SELECT COALESCE(MAX(topic_id), 0), COALESCE(SUM(ticket_count), 0) FROM ticket_topic", ()),
+    "topic_counts": ("SELECT topic_id, ticket_count FROM ticket_topic", ()),
+}
+
+# Every statement the pages issue, with representative parameters, so
+# `check` can EXPLAIN them. Ticket reads come from the tickets.*_query
+# builders in each filter and sort variant the pages offer, and the cache
+# and topic index statements from their modules, so they cannot drift.
+# Imported here, not at the top: those modules import schema.
+def page_queries():
+    import analytics
+    import tickets
+    import topics
+    import workqueue
+
+    queries = {
+        "login": tickets.login_user_query("someone@example.com", "0" * 64, "Customer"),
+        "get_user_details": tickets.user_details_query(1),
+        "get_user_name": tickets.user_name_query(1),
+        "get_user_tickets": tickets.user_tickets_query(1),
+        "get_user_tickets_with_archive": tickets.user_tickets_query(1, include_archived=True),
+        "get_user_tickets_filtered": tickets.user_tickets_query(
+            1, filters=(("statuses", ("Open",)),), sort="Oldest first"),
+        "get_ticket_details": tickets.ticket_details_query([1, 2]),
+        "get_archived_ticket_details": tickets.ticket_details_query([1, 2], ARCHIVE_TABLE),
+        "get_archived_tickets_first_page": tickets.all_tickets_query(archived=True),
+        "search_tickets": tickets.search_query("login failure"),
+        "search_tickets_filtered": tickets.search_query("login failure", filters=(("statuses", ("Open",)),)),
+        "search_ticket_id": tickets.search_query("#123"),
+        "ticket_comments_first_page": tickets.ticket_comments_query(1),
+        "ticket_comments_older_page": tickets.ticket_comments_query(1, before=("2030-01-01", 1)),
+    }
+    filters = {
+        "": None,
+        "_by_status": (("statuses", ("Open",)),),
+        "_by_priority": (("priorities", ("High",)),),
+        "_by_raised_date": (("raised_from", date(2024, 1, 1)), ("raised_to", date(2024, 12, 31))),
+    }
+    for sort in tickets.SORTS:
+        slug = sort.lower().replace(" ", "_")
+        for suffix, ticket_filters in filters.items():
+            queries[f"get_all_tickets_{slug}{suffix}"] = tickets.all_tickets_query(
+                filters=ticket_filters, sort=sort)
+        queries[f"get_all_tickets_{slug}_next_page"] = tickets.all_tickets_query(
+            after=("2030-01-01", 1), sort=sort)
+    queries = {name: (query, params) for name, (query, params, _) in queries.items()}
+
+    queries.update({
+        "analytics_watermark": (analytics.WATERMARK_SQL, ()),
+        "analytics_window_count": (analytics.WINDOW_COUNT_SQL, (1 << 30,)),
+        "analytics_changes": (analytics.CHANGES_SQL, (1 << 30, "2030-01-01")),
+        "analytics_tracked_tickets": (analytics.TRACKED_SQL, (1 << 30, "2030-01-01")),
+        "analytics_user_status_top": (analytics.USER_STATUS_TOP_SQL, (analytics.TOP_USERS,)),
+        "topic_unindexed_tickets": (topics.UNINDEXED_SQL, (1 << 30, topics.CHUNK_SIZE)),
+        "claim_next_ticket": (workqueue.CLAIM_SQL, ("High",)),
+        "claimed_tickets": (workqueue.CLAIMED_SQL, (1,)),
+        "queue_depth": (workqueue.QUEUE_DEPTH_SQL, ()),
+    })
+    queries.update(OTHER_QUERIES)
+    return queries
+
+
+# Plans that are accepted despite a full scan or filesort, with the reason
+ALLOWED = {
+    # Sorts only the full-text matches by relevance
+    "search_tickets": {"filesort"},
+    "search_tickets_filtered": {"filesort"},
+    # Open tickets are a small share of the table; the ranges on
+    # idx_ticket_status and the overlap window exclude the closed ones,
+    # sorting the remainder is cheap
+    "analytics_tracked_tickets": {"filesort"},
+    # One row per topic, read only when another process added assignments
+    "topic_counts": {"scan"},
+    # Same small table, summed to notice other processes' assignments
+    "topic_state": {"scan"},
+    # Reads the covering idx_ticket_customer_status index, not the table;
+    # ranking and grouping happen on one row per customer and status, and
+    # the result is cached until the next ticket write
+    "analytics_user_status_top": {"filesort"},
+    # An agent holds a handful of tickets at a time
+    "claimed_tickets": {"filesort"},
+    # One row per day, priority and status, folded into at most
+    # analytics.MAX_POINTS periods
+    "ticket_volume_weekly": {"filesort"},
+}
+
+
+# EXPLAIN each page query; returns a list of (query name, table, problem)
+def check_plans(min_rows=1000):
+    problems = []
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        for name, (query, params) in page_queries().items():
+            cursor.execute("EXPLAIN " + query, params)
+            allowed = ALLOWED.get(name, set())
+            for row in cursor.fetchall():
+                table = row.get("table")
+                rows = row.get("rows") or 0
+                extra = row.get("Extra") or ""
+                if rows < min_rows or (table or "").startswith("<"):
+                    continue
+                if row.get("type") == "ALL" and "scan" not in allowed:
+                    problems.append((name, table, f"full table scan (~{rows} rows)"))
+                if "Using filesort" in extra and "filesort" not in allowed:
+                    problems.append((name, table, f"filesort (~{rows} rows)"))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CQMS schema management")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="apply pending migrations")
+    sub.add_parser("status", help="show the applied schema version")
+    sub.add_parser("rebuild-rollups", help="recompute the analytics rollups from all tickets")
+    check = sub.add_parser("check", help="EXPLAIN page queries and fail on full scans or filesorts")
+    check.add_argument("--min-rows", type=int, default=1000,
+                       help="ignore plan steps estimated below this many rows")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        applied = migrate(verbose=True)
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+        return 0
+
+    if args.command == "rebuild-rollups":
+        rebuild_rollups()
+        print("Rollups rebuilt")
+        return 0
+
+    if args.command == "status":
+        with db_connection() as conn:
+            version = applied_version(conn.cursor())
+        print(f"Schema version {version} of {MIGRATIONS[-1][0]}")
+        return 0
+
+    problems = check_plans(args.min_rows)
+    for name, table, problem in problems:
+        print(f"FAIL {name}: {table}: {problem}")
+    if problems:
+        return 1
+    print(f"OK: {len(page_queries())} queries checked")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
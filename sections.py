@@ -0,0 +1,227 @@
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import querylog
+from dataservice import get_ticket_comments
+from db import pool_stats
+from export import FORMATS, PRIORITIES, STATUSES, export_tickets
+from resultcache import get_result_cache
+from schema import SchemaOutdated, ensure_schema
+from tickets import COMMENT_PAGE_SIZE, DEFAULT_SORT, SORTS
+from writequeue import WriteQueueFull
+
+# Replacement for st.tabs: st.tabs runs every tab body on each rerun, while
+# a page built on section_nav() only runs the branch for the selected
+# section.
+
+
+def section_nav(sections, key):
+    return st.radio("Section", sections, horizontal=True, key=key, label_visibility="collapsed")
+
+
+# Results kept per session; every distinct argument tuple is its own
+# entry, so the least recently used ones are dropped beyond this
+SESSION_CACHE_ENTRIES = 50
+
+
+# Run loader(*args) at most once per session (or once per `ttl` seconds)
+# and hand back the stored result on later reruns. Not for the dataservice
+# ticket reads: resultcache already reuses them until a write, and a copy
+# here would hide other sessions' writes from this one.
+def session_cached(name, loader, *args, ttl=None):
+    store = st.session_state.setdefault("_section_data", OrderedDict())
+    key = (name, args)
+    entry = store.get(key)
+    if entry is not None:
+        loaded_at, value = entry
+        if ttl is None or time.monotonic() - loaded_at < ttl:
+            store.move_to_end(key)
+            return value
+        del store[key]
+    value = loader(*args)
+    store[key] = (time.monotonic(), value)
+    while len(store) > SESSION_CACHE_ENTRIES:
+        store.popitem(last=False)
+    return value
+
+
+# Drop cached results for the given names (all of them if none given),
+# typically right after a write that changes them
+def invalidate_session_data(*names):
+    store = st.session_state.get("_section_data")
+    if not store:
+        return
+    if not names:
+        store.clear()
+        return
+    for key in [k for k in store if k[0] in names]:
+        del store[key]
+
+
+# Filter and sort widgets for a ticket list, in a collapsed expander.
+# Returns (filters, sort): filters as a tuple of (name, value) pairs for
+# tickets.ticket_filter_sql(), hashable so it can be part of a
+# cache key, and a tickets.SORTS label.
+def ticket_filter_controls(key, company_filter=False):
+    with st.expander("🔎 Filter and sort"):
+        status_col, priority_col, sort_col = st.columns(3)
+        statuses = status_col.multiselect("Status", STATUSES, key=f"{key}_statuses")
+        priorities = priority_col.multiselect("Priority", PRIORITIES, key=f"{key}_priorities")
+        sort = sort_col.selectbox("Sort by", list(SORTS), index=list(SORTS).index(DEFAULT_SORT),
+                                  key=f"{key}_sort")
+        from_col, to_col = st.columns(2)
+        raised_from = from_col.date_input("Raised from", value=None, key=f"{key}_from")
+        raised_to = to_col.date_input("Raised to", value=None, key=f"{key}_to")
+        review_col, stars_col = st.columns(2)
+        review = review_col.selectbox("Review", ["Any", "With review", "Without review"], key=f"{key}_review")
+        min_stars = stars_col.selectbox("Minimum rating", [0, 1, 2, 3, 4, 5], key=f"{key}_stars",
+                                        format_func=lambda n: "Any" if n == 0 else "⭐" * n)
+        company = st.text_input("Company name starts with", key=f"{key}_company") if company_filter else ""
+
+    filters = {
+        "statuses": tuple(statuses),
+        "priorities": tuple(priorities),
+        "raised_from": raised_from,
+        "raised_to": raised_to,
+        "company": company.strip(),
+        "has_review": {"With review": True, "Without review": False}.get(review),
+        "min_stars": min_stars,
+    }
+    return tuple(sorted((name, value) for name, value in filters.items()
+                        if value not in (None, "", (), 0))), sort
+
+
+# A ticket's comment thread, oldest first. The newest page is loaded when
+# the ticket is opened; each "Show older comments" click loads one more.
+def comment_thread(ticket_id):
+    cursors = st.session_state.setdefault("comment_cursors", {}).setdefault(ticket_id, [None])
+    pages = [get_ticket_comments(ticket_id, COMMENT_PAGE_SIZE, before) for before in cursors]
+    comments = [comment for rows, _ in pages for comment in rows]
+    if pages[-1][1] and st.button("⬆️ Show older comments", key=f"older_comments_{ticket_id}"):
+        oldest = comments[-1]
+        cursors.append((oldest["created_at"], oldest["comment_id"]))
+        st.rerun()
+    if not comments:
+        st.caption("No comments yet")
+    for comment in reversed(comments):
+        st.markdown(f"**{comment['author'] or 'Support'}** · {comment['created_at']:%Y-%m-%d %H:%M}")
+        st.markdown(comment["body"])
+
+
+# Mark the start of a page rerun so querylog groups its statements. Also
+# checks, before the page borrows any connection, that the schema has been
+# migrated; pages never migrate it themselves.
+def begin_page(page):
+    try:
+        ensure_schema()
+    except SchemaOutdated as e:
+        st.error(f"❌ {e}")
+        st.stop()
+    ctx = get_script_run_ctx()
+    querylog.begin_rerun(ctx.session_id if ctx else None, page)
+
+
+# Roles allowed to see the query debug panel; it shows every session's SQL
+DEBUG_ROLES = {"Support"}
+
+
+# Query counters for this rerun and session, the slow-query log and pool
+# stats. Shown only to logged-in DEBUG_ROLES users, and only with
+# CQMS_DEBUG=1 or ?debug=1 in the URL.
+def query_debug_panel():
+    if not st.session_state.get("logged_in") or st.session_state.get("role") not in DEBUG_ROLES:
+        return
+    if os.environ.get("CQMS_DEBUG") != "1" and st.query_params.get("debug") != "1":
+        return
+    rerun = querylog.current_rerun()
+    with st.expander("🐞 Query log"):
+        if rerun is not None:
+            summary = rerun.summary()
+            st.caption(f"This rerun of {summary['page']}: {summary['queries']} queries, "
+                       f"{summary['total_ms']:.1f} ms, {summary['rows']} rows")
+            st.dataframe(pd.DataFrame([e.as_dict() for e in rerun.entries],
+                                      columns=["caller", "sql", "duration_ms", "rows"]),
+                         use_container_width=True, hide_index=True)
+            st.markdown("**This session**")
+            st.dataframe(querylog.query_stats(rerun.session), use_container_width=True, hide_index=True)
+        st.markdown(f"**Slow queries (≥ {querylog.SLOW_MS:.0f} ms)**")
+        st.dataframe(querylog.slow_queries(), use_container_width=True, hide_index=True)
+        st.markdown("**Connection pool**")
+        st.json(pool_stats())
+        st.markdown("**Result cache**")
+        st.json(get_result_cache().stats())
+        st.download_button("Download query stats (JSONL)", querylog.stats_jsonl(),
+                           file_name="query_stats.jsonl", mime="application/jsonl",
+                           key="dump_query_stats")
+
+
+# Run a write helper and keep its handle, so pending_writes_status() can
+# report it on later reruns when write-behind is on
+def submit_write(label, write, *args):
+    try:
+        handle = write(*args)
+    except WriteQueueFull as e:
+        st.error(f"❌ {label} could not be saved right now, please retry ({e})")
+        return None
+    st.session_state.setdefault("pending_writes", []).append((label, handle))
+    return handle
+
+
+# Report failed writes and how many are still queued; drops committed ones
+def pending_writes_status():
+    writes = st.session_state.get("pending_writes")
+    if not writes:
+        return
+    pending = []
+    for label, handle in writes:
+        if handle.status == "failed":
+            st.error(f"❌ {label} failed: {handle.error}")
+        elif handle.status == "pending":
+            pending.append((label, handle))
+    if pending:
+        st.caption(f"⏳ {len(pending)} change(s) still being saved…")
+    st.session_state.pending_writes = pending
+
+
+# Export form for agents. The file is handed to st.download_button as
+# bytes in the rerun that prepared it and not kept: the button, and the
+# copy Streamlit holds for it, go away on the next rerun, so a later
+# export needs "Prepare export" again.
+def ticket_export_form():
+    with st.expander("⬇️ Export tickets"):
+        with st.form("export_form"):
+            date_col1, date_col2 = st.columns(2)
+            with date_col1:
+                date_from = st.date_input("Raised from", value=None)
+            with date_col2:
+                date_to = st.date_input("Raised to", value=None)
+            statuses = st.multiselect("Status", STATUSES)
+            priorities = st.multiselect("Priority", PRIORITIES)
+            fmt = st.selectbox("Format", FORMATS)
+            include_archived = st.checkbox("Include archived tickets")
+            prepare = st.form_submit_button("Prepare export")
+
+        if not prepare:
+            return
+        # Streamed to disk while the query runs, read back once at the end
+        with tempfile.TemporaryFile() as out:
+            try:
+                with st.spinner("Exporting…"):
+                    count = export_tickets(out, fmt, date_from=date_from, date_to=date_to,
+                                           statuses=statuses, priorities=priorities,
+                                           include_archived=include_archived)
+            except RuntimeError as e:
+                st.error(f"❌ {e}")
+                return
+            out.seek(0)
+            data = out.read()
+        st.download_button(f"Download {count} ticket(s) as {fmt.upper()}", data,
+                           file_name=f"tickets_{datetime.now():%Y%m%d_%H%M}.{fmt}",
+                           mime="text/csv" if fmt == "csv" else "application/octet-stream")
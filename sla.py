@@ -0,0 +1,160 @@
+import math
+from collections import Counter
+from datetime import date, timedelta
+
+import pandas as pd
+
+from db import read_connection
+from schema import SLA_GAMMA, ensure_schema
+
+# Resolution and first-response percentiles per priority. Samples are
+# minutes, counted into logarithmic buckets (a DDSketch): two sketches merge
+# by adding bucket counts, any quantile is read back within SLA_ALPHA
+# relative error, and the bucket count depends on the range of values, not
+# on how many tickets there are. ticket_sla_sketch holds one sketch per
+# metric, day and priority; a window is the merge of its days.
+
+METRICS = {"resolution": "Resolution", "first_response": "First response"}
+QUANTILES = (0.5, 0.9, 0.99)
+_LOG_GAMMA = math.log(SLA_GAMMA)
+
+
+def bucket_of(minutes):
+    if minutes < 1:
+        return 0
+    return math.ceil(math.log(minutes) / _LOG_GAMMA) + 1
+
+
+# Representative value of a bucket, within SLA_ALPHA of every value in it
+def bucket_value(bucket):
+    if bucket == 0:
+        return 0.0
+    return 2 * SLA_GAMMA ** (bucket - 1) / (SLA_GAMMA + 1)
+
+
+def minutes_between(start, end):
+    return (end - start).total_seconds() / 60
+
+
+class QuantileSketch:
+    def __init__(self, buckets=None):
+        self.buckets = Counter(buckets or {})
+
+    def add(self, minutes, count=1):
+        self.buckets[bucket_of(minutes)] += count
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        return self
+
+    @property
+    def count(self):
+        return sum(n for n in self.buckets.values() if n > 0)
+
+    def quantile(self, q):
+        buckets = sorted((b, n) for b, n in self.buckets.items() if n > 0)
+        if not buckets:
+            return None
+        rank = q * (sum(n for _, n in buckets) - 1)
+        seen = 0
+        for bucket, n in buckets:
+            seen += n
+            if seen > rank:
+                return bucket_value(bucket)
+        return bucket_value(buckets[-1][0])
+
+
+# Sketches per priority for one metric, merged over [since, until)
+def load_sketches(metric, since=None, until=None):
+    ensure_schema()
+    since = since or date(1970, 1, 1)
+    until = until or date.today() + timedelta(days=1)
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT priority, bucket, SUM(ticket_count)
+            FROM ticket_sla_sketch
+            WHERE metric = %s AND day >= %s AND day < %s
+            GROUP BY priority, bucket
+        """, (metric, since, until))
+        rows = cursor.fetchall()
+    sketches = {}
+    for priority, bucket, count in rows:
+        sketches.setdefault(priority, QuantileSketch()).buckets[int(bucket)] += int(count)
+    return sketches
+
+
+# One row per metric and priority (plus "All") with the ticket count and
+# p50/p90/p99 in hours, for tickets resolved / first answered in the window
+def sla_percentiles(since=None, until=None):
+    rows = []
+    for metric, label in METRICS.items():
+        sketches = load_sketches(metric, since, until)
+        overall = QuantileSketch()
+        for priority in sorted(sketches):
+            overall.merge(sketches[priority])
+        for priority, sketch in sorted(sketches.items()) + [("All", overall)]:
+            if not sketch.count:
+                continue
+            row = {"Metric": label, "Priority": priority, "Tickets": sketch.count}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)} (h)"] = round(sketch.quantile(q) / 60, 2)
+            rows.append(row)
+    columns = ["Metric", "Priority", "Tickets"] + [f"p{round(q * 100)} (h)" for q in QUANTILES]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _bump(cursor, deltas):
+    rows = [(metric, day, priority, bucket, delta)
+            for (metric, day, priority, bucket), delta in deltas.items() if delta]
+    if rows:
+        cursor.executemany("""
+            INSERT INTO ticket_sla_sketch (metric, day, priority, bucket, ticket_count)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE ticket_count = ticket_count + VALUES(ticket_count)
+        """, rows)
+
+
+# Sketch updates for a batch of status changes, inside the caller's
+# transaction. `changes` holds (priority, raised_on, old_closed_on,
+# new_closed_on) per ticket; closed_on is None when not closed.
+def record_resolutions(cursor, changes):
+    deltas = Counter()
+    for priority, raised_on, old_closed_on, new_closed_on in changes:
+        if old_closed_on is not None:
+            deltas[("resolution", old_closed_on.date(), priority,
+                    bucket_of(minutes_between(raised_on, old_closed_on)))] -= 1
+        if new_closed_on is not None:
+            deltas[("resolution", new_closed_on.date(), priority,
+                    bucket_of(minutes_between(raised_on, new_closed_on)))] += 1
+    _bump(cursor, deltas)
+
+
+# Stamp first_response_on on those of `ticket_ids` that have none yet and
+# count them in the sketch; call inside the transaction of the response
+def record_first_responses(cursor, ticket_ids, responded_on):
+    ticket_ids = list(dict.fromkeys(ticket_ids))
+    if not ticket_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(ticket_ids))
+    cursor.execute(f"""
+        SELECT ticket_id, priority, ticket_raised_on
+        FROM support_ticket
+        WHERE ticket_id IN ({placeholders}) AND first_response_on IS NULL
+        FOR UPDATE
+    """, tuple(ticket_ids))
+    rows = cursor.fetchall()
+    if not rows:
+        return
+    if isinstance(rows[0], dict):
+        rows = [(r["ticket_id"], r["priority"], r["ticket_raised_on"]) for r in rows]
+    placeholders = ", ".join(["%s"] * len(rows))
+    cursor.execute(f"""
+        UPDATE support_ticket SET first_response_on = %s
+        WHERE ticket_id IN ({placeholders})
+    """, (responded_on, *[row[0] for row in rows]))
+    deltas = Counter()
+    for _, priority, raised_on in rows:
+        deltas[("first_response", responded_on.date(), priority,
+                bucket_of(minutes_between(raised_on, responded_on)))] += 1
+    _bump(cursor, deltas)
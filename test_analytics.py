@@ -0,0 +1,109 @@
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+from analytics import MAX_POINTS, AnalyticsCache, change_ticket_statuses, volume_period
+
+
+@pytest.mark.parametrize("days, period", [
+    (1, "Day"),
+    (MAX_POINTS, "Day"),
+    (MAX_POINTS + 1, "Week"),
+    (7 * MAX_POINTS, "Week"),
+    (7 * MAX_POINTS + 1, "Month"),
+    (31 * MAX_POINTS + 1, "Year"),
+    (366 * MAX_POINTS + 1, "Year"),
+])
+def test_volume_period_is_the_finest_within_max_points(days, period):
+    first = date(2020, 1, 1)
+    name, expr = volume_period(first, first + timedelta(days=days - 1))
+    assert name == period
+    assert expr
+
+
+def test_volume_period_respects_max_points():
+    first = date(2024, 1, 1)
+    assert volume_period(first, first + timedelta(days=29), max_points=30)[0] == "Day"
+    assert volume_period(first, first + timedelta(days=30), max_points=30)[0] == "Week"
+
+
+def empty_cache(max_id=100):
+    cache = AnalyticsCache()
+    cache._priority_status = Counter()
+    cache._resolution = Counter()
+    cache._tracked = OrderedDict()
+    cache._max_id = max_id
+    return cache
+
+
+RAISED = datetime(2024, 1, 1, 9, 0)
+
+
+def row(ticket_id, status, closed_on=None, priority="High"):
+    return ticket_id, priority, status, RAISED, closed_on
+
+
+def test_apply_counts_a_new_ticket():
+    cache = empty_cache()
+    assert cache._apply(row(101, "Open"), since_id=0)
+    assert cache._priority_status == {("High", "Open"): 1}
+    assert cache._tracked[101] == ("High", "Open", None)
+
+
+# Rows in the overlap window are read again on every refresh
+def test_apply_is_a_no_op_for_an_unchanged_row():
+    cache = empty_cache()
+    cache._apply(row(101, "open "), since_id=0)
+    assert cache._apply(row(101, "Open"), since_id=0)
+    assert cache._priority_status == {("High", "Open"): 1}
+
+
+def test_apply_moves_counts_on_close_and_reopen():
+    cache = empty_cache()
+    cache._apply(row(101, "Open"), since_id=0)
+    cache._apply(row(101, "Closed", RAISED + timedelta(hours=5, minutes=30)), since_id=0)
+    assert +cache._priority_status == {("High", "Closed"): 1}
+    assert +cache._resolution == {5: 1}
+    cache._apply(row(101, "In Progress"), since_id=0)
+    assert +cache._priority_status == {("High", "In Progress"): 1}
+    assert +cache._resolution == {}
+
+
+def test_apply_counts_a_late_insert_inside_the_window():
+    cache = empty_cache(max_id=100)
+    assert cache._apply(row(95, "Open"), since_id=90)
+    assert cache._priority_status == {("High", "Open"): 1}
+
+
+def test_apply_refuses_an_untracked_ticket_below_the_window():
+    cache = empty_cache(max_id=100)
+    assert not cache._apply(row(50, "Closed", RAISED + timedelta(hours=1)), since_id=90)
+    assert not cache._priority_status
+
+
+class LockingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, query, params=()):
+        self.statements.append((" ".join(query.split()), params))
+
+    def fetchall(self):
+        return self.rows
+
+
+# The close is decided under the row lock: a ticket that left from_status
+# since the caller read it is not changed
+def test_status_change_rechecks_from_status_under_the_lock():
+    cursor = LockingCursor([])
+    assert change_ticket_statuses(cursor, [7], "Closed", from_status="Open") == 0
+    [(query, params)] = cursor.statements
+    assert "AND status = %s" in query and query.endswith("FOR UPDATE")
+    assert params == (7, "Closed", "Open")
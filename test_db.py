@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+mysql_connector = pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+from db import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.rollbacks = 0
+        self.closed = False
+        self.broken = False
+
+    def ping(self, reconnect=False):
+        if self.broken:
+            raise mysql_connector.errors.OperationalError("gone away")
+
+    def rollback(self):
+        if self.broken:
+            raise mysql_connector.errors.OperationalError("gone away")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(size=1, timeout=0.2)
+    pool.opened = []
+
+    def connect():
+        conn = FakeConnection()
+        pool.opened.append(conn)
+        return conn
+
+    pool._connect = connect
+    return pool
+
+
+def test_released_connection_is_rolled_back_and_reused(pool):
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+    assert raw.rollbacks == 1
+    second = pool.acquire()
+    assert second._conn is raw
+    assert len(pool.opened) == 1
+    assert pool.stats()["in_use"] == 1
+
+
+def test_acquire_times_out_when_pool_is_exhausted(pool):
+    held = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(mysql_connector.errors.PoolError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.2
+    held.close()
+
+
+def test_waiter_gets_a_returned_connection(pool):
+    pool.timeout = 5
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    held.close()
+    waiter.join(1)
+    assert got and got[0]._conn is pool.opened[0]
+
+
+# A broken connection is discarded on release; its slot must go to the
+# waiter right away, not after the timeout
+def test_discarding_a_broken_connection_wakes_a_waiter(pool):
+    pool.timeout = 5
+    held = pool.acquire()
+    held._conn.broken = True
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    held.close()
+    waiter.join(1)
+    assert got
+    assert time.monotonic() - started < 1
+    assert pool.opened[0].closed
+    assert got[0]._conn is pool.opened[1]
+    assert pool.stats()["created"] == 1
+
+
+def test_dead_idle_connection_is_replaced(pool):
+    first = pool.acquire()
+    first.close()
+    pool.opened[0].broken = True
+    second = pool.acquire()
+    assert second._conn is pool.opened[1]
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_failed_connect_frees_the_slot(pool):
+    def refuse():
+        raise mysql_connector.errors.InterfaceError("refused")
+
+    connect, pool._connect = pool._connect, refuse
+    with pytest.raises(mysql_connector.Error):
+        pool.acquire()
+    pool._connect = connect
+    assert pool.acquire() is not None
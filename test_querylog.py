@@ -0,0 +1,51 @@
+from querylog import _caller, normalize
+
+
+def test_normalize_replaces_literals_and_placeholders():
+    sql = "SELECT * FROM support_ticket WHERE status = 'Open' AND priority = %s LIMIT 26"
+    assert normalize(sql) == "SELECT * FROM support_ticket WHERE status = ? AND priority = ? LIMIT ?"
+
+
+def test_normalize_collapses_whitespace():
+    sql = """
+        SELECT ticket_id
+        FROM   support_ticket
+        WHERE  ticket_id = 1
+    """
+    assert normalize(sql) == "SELECT ticket_id FROM support_ticket WHERE ticket_id = ?"
+
+
+def test_normalize_folds_in_lists_of_any_length():
+    one = normalize("SELECT * FROM support_ticket WHERE ticket_id IN (%s)")
+    three = normalize("SELECT * FROM support_ticket WHERE ticket_id in (1, 2, 3)")
+    assert one == "SELECT * FROM support_ticket WHERE ticket_id IN (...)"
+    assert three == "SELECT * FROM support_ticket WHERE ticket_id IN (...)"
+
+
+def test_normalize_handles_escaped_quotes_and_decimals():
+    sql = r"UPDATE support_ticket SET subject = 'It\'s broken', review_stars = 4.5 WHERE ticket_id = 7"
+    assert normalize(sql) == "UPDATE support_ticket SET subject = ?, review_stars = ? WHERE ticket_id = ?"
+
+
+def test_normalize_keeps_identifiers_with_digits():
+    assert normalize("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+__querylog_skip__ = {"_plumbing"}
+
+
+def _plumbing():
+    return _execute()
+
+
+# Stands in for the cursor method that calls _caller()
+def _execute():
+    return _caller()
+
+
+def helper():
+    return _plumbing()
+
+
+def test_caller_skips_functions_marked_by_their_module():
+    assert helper() == "test_querylog.py:helper"
@@ -0,0 +1,81 @@
+import resultcache
+from resultcache import ResultCache
+
+
+class Loader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_hit_returns_a_copy_without_reloading():
+    cache = ResultCache()
+    load = Loader([{"ticket_id": 1}])
+    first = cache.get("key", ("tickets",), load)
+    first[0]["ticket_id"] = 99
+    second = cache.get("key", ("tickets",), load)
+    assert second == [{"ticket_id": 1}]
+    assert load.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_bump_makes_entries_of_that_entity_stale():
+    cache = ResultCache()
+    tickets, user = Loader("tickets"), Loader("user")
+    cache.get("tickets", ("tickets",), tickets)
+    cache.get("user", (("user", 1),), user)
+    cache.bump("tickets")
+    cache.get("tickets", ("tickets",), tickets)
+    cache.get("user", (("user", 1),), user)
+    assert tickets.calls == 2
+    assert user.calls == 1
+    assert cache.stats()["stale"] == 1
+
+
+# A write committing while the query runs must not leave its stale result
+# cached under the new generation
+def test_bump_during_load_drops_the_result():
+    cache = ResultCache()
+
+    def load():
+        cache.bump("tickets")
+        return "read before the write"
+
+    cache.get("key", ("tickets",), load)
+    fresh = Loader("read after the write")
+    assert cache.get("key", ("tickets",), fresh) == "read after the write"
+    assert fresh.calls == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resultcache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(ttl=30)
+    load = Loader("value")
+    cache.get("key", (), load)
+    now[0] += 29
+    cache.get("key", (), load)
+    assert load.calls == 1
+    now[0] += 2
+    cache.get("key", (), load)
+    assert load.calls == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    loads = {key: Loader(key) for key in "abc"}
+    cache.get("a", (), loads["a"])
+    cache.get("b", (), loads["b"])
+    cache.get("a", (), loads["a"])
+    cache.get("c", (), loads["c"])
+    cache.get("a", (), loads["a"])
+    cache.get("b", (), loads["b"])
+    assert loads["a"].calls == 1
+    assert loads["b"].calls == 2
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+from streamlit.testing.v1 import AppTest
+
+
+def export_page():
+    import sections
+
+    def export_tickets(out, fmt, **filters):
+        out.write(b"ticket_id\n1\n2\n")
+        return 2
+
+    sections.export_tickets = export_tickets
+    sections.ticket_export_form()
+
+
+def download_buttons(at):
+    return at.get("download_button")
+
+
+# The prepared file is handed over as bytes once; neither that rerun nor
+# the next (the one a click on the download button triggers) may fail
+def test_export_is_offered_once_and_not_kept():
+    at = AppTest.from_function(export_page)
+    at.run()
+    assert not download_buttons(at)
+
+    next(b for b in at.button if b.label == "Prepare export").click()
+    at.run()
+    assert not at.exception
+    assert len(download_buttons(at)) == 1
+    assert "ticket_export" not in at.session_state
+
+    at.run()
+    assert not at.exception
+    assert not download_buttons(at)
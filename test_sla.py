@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+from schema import SLA_ALPHA
+from sla import QuantileSketch, bucket_of, bucket_value
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def test_bucket_value_is_within_alpha_of_its_samples():
+    for minutes in (1, 1.5, 7, 59, 60, 61, 1440, 10_000, 525_600):
+        value = bucket_value(bucket_of(minutes))
+        assert abs(value - minutes) <= SLA_ALPHA * minutes * 1.0001
+
+
+def test_under_a_minute_shares_bucket_zero():
+    assert bucket_of(0) == bucket_of(0.5) == 0
+    assert bucket_value(0) == 0.0
+    assert bucket_of(1) > 0
+
+
+def test_empty_sketch_has_no_quantile():
+    assert QuantileSketch().quantile(0.5) is None
+    assert QuantileSketch().count == 0
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.99])
+def test_quantiles_within_relative_error(q):
+    rng = random.Random(1)
+    values = [rng.lognormvariate(5, 1.5) + 1 for _ in range(5000)]
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    exact = exact_quantile(values, q)
+    assert abs(sketch.quantile(q) - exact) <= SLA_ALPHA * exact * 1.0001
+
+
+def test_merge_equals_sketch_of_all_values():
+    rng = random.Random(2)
+    first = [rng.uniform(1, 600) for _ in range(300)]
+    second = [rng.uniform(60, 6000) for _ in range(700)]
+    a, b, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for value in first:
+        a.add(value)
+        both.add(value)
+    for value in second:
+        b.add(value)
+        both.add(value)
+    merged = a.merge(b)
+    assert merged.buckets == both.buckets
+    assert merged.count == 1000
+    for q in (0.5, 0.9, 0.99):
+        assert merged.quantile(q) == both.quantile(q)
+
+
+# A reopened ticket removes its old sample with a negative count
+def test_removed_samples_are_ignored():
+    sketch = QuantileSketch()
+    sketch.add(30)
+    sketch.add(600)
+    sketch.add(600, count=-1)
+    assert sketch.count == 1
+    assert sketch.quantile(0.99) == bucket_value(bucket_of(30))
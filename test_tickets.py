@@ -0,0 +1,95 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+import tickets
+from tickets import DEFAULT_SORT, _sort_sql, page_cursor, ticket_filter_sql
+from writequeue import WriteHandle
+
+
+def test_no_filters_add_no_conditions():
+    assert ticket_filter_sql(None) == ([], [])
+    assert ticket_filter_sql(()) == ([], [])
+
+
+def test_value_lists_become_in_conditions():
+    where, params = ticket_filter_sql((("priorities", ("High", "Low")), ("statuses", ("Open",))))
+    assert where == ["t.status IN (%s)", "t.priority IN (%s, %s)"]
+    assert params == ["Open", "High", "Low"]
+
+
+def test_raised_to_is_inclusive():
+    where, params = ticket_filter_sql((("raised_from", date(2024, 1, 1)), ("raised_to", date(2024, 1, 31))))
+    assert where == ["t.ticket_raised_on >= %s", "t.ticket_raised_on < %s"]
+    assert params == [date(2024, 1, 1), date(2024, 2, 1)]
+
+
+def test_company_prefix_escapes_like_wildcards():
+    where, params = ticket_filter_sql((("company", " 100%_Acme "),))
+    assert where == ["t.customer_id IN (SELECT customer_id FROM customer_profile WHERE company_name LIKE %s)"]
+    assert params == ["100\\%\\_Acme%"]
+
+
+def test_review_and_rating_filters():
+    where, params = ticket_filter_sql((("has_review", False), ("min_stars", 4)), alias="a")
+    assert where == ["a.customer_review IS NULL", "a.review_stars >= %s"]
+    assert params == [4]
+    assert ticket_filter_sql((("has_review", True),))[0] == ["t.customer_review IS NOT NULL"]
+
+
+def test_default_sort_first_page():
+    where, params, order = _sort_sql(DEFAULT_SORT, None)
+    assert where == []
+    assert params == []
+    assert order == "ORDER BY t.ticket_raised_on DESC, t.ticket_id DESC"
+
+
+def test_sort_continues_after_cursor_in_sort_direction():
+    where, params, order = _sort_sql("Oldest first", ("2024-01-01", 7))
+    assert where == ["(t.ticket_raised_on > %s OR (t.ticket_raised_on = %s AND t.ticket_id > %s))"]
+    assert params == ["2024-01-01", "2024-01-01", 7]
+    assert order == "ORDER BY t.ticket_raised_on ASC, t.ticket_id ASC"
+
+
+def test_recently_closed_skips_open_tickets_and_can_be_unqualified():
+    where, params, order = _sort_sql("Recently closed", None, qualified=False)
+    assert where == ["t.ticket_closed_on IS NOT NULL"]
+    assert order == "ORDER BY ticket_closed_on DESC, ticket_id DESC"
+
+
+def test_page_cursor_uses_the_sort_column():
+    row = {"ticket_id": 5, "ticket_raised_on": "raised", "ticket_closed_on": "closed"}
+    assert page_cursor(row) == ("raised", 5)
+    assert page_cursor(row, "Recently closed") == ("closed", 5)
+
+
+@pytest.fixture
+def sync_writes(monkeypatch):
+    noted = []
+    monkeypatch.setattr(tickets, "WRITE_BEHIND", False)
+    monkeypatch.setattr(tickets, "note_write", lambda: noted.append(True))
+    monkeypatch.setattr(tickets, "invalidate", lambda *entities: None)
+
+    def run_now(op, *args, on_commit=None):
+        handle = WriteHandle(op.__name__, on_commit)
+        handle._finish(op(None, *args))
+        return handle
+
+    monkeypatch.setattr(tickets, "run_now", run_now)
+    return noted
+
+
+# Only a write that changed rows pins the session's reads to the primary
+def test_sync_write_notes_the_write_only_when_rows_changed(sync_writes):
+    def changes(cursor, rows):
+        return rows
+
+    tickets._write(changes, 0)
+    assert sync_writes == []
+    tickets._write(changes, 1)
+    assert sync_writes == [True]
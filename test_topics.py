@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+from topics import BANDS, NUM_PERM, THRESHOLD, TopicIndex, _bands, normalize, signatures
+
+
+def similarity(a, b):
+    first, second = signatures(pd.Series([a, b]))
+    return np.count_nonzero(first == second) / NUM_PERM
+
+
+def test_normalize_lowercases_and_strips_punctuation_and_plurals():
+    texts = pd.Series(["Login issue", "login issues!", "  Class  ", None])
+    assert normalize(texts).tolist() == ["login issue", "login issue", "class", ""]
+
+
+def test_signatures_shape_and_determinism():
+    texts = pd.Series(["Password reset", "Invoice missing", "Slow dashboard"])
+    sigs = signatures(texts)
+    assert sigs.shape == (3, NUM_PERM)
+    assert sigs.dtype == np.uint64
+    assert (signatures(texts) == sigs).all()
+
+
+# A ticket's signature must not depend on the rest of its indexing chunk
+def test_signature_is_independent_of_the_batch():
+    alone = signatures(pd.Series(["Refund request"]))[0]
+    in_batch = signatures(pd.Series(["Account locked", "Refund request", "Data export"]))[1]
+    assert (alone == in_batch).all()
+
+
+def test_same_normalised_text_gets_the_same_signature():
+    assert similarity("Login issue", "login issues!") == 1.0
+
+
+def test_similar_subjects_clear_the_threshold_and_unrelated_ones_do_not():
+    assert similarity("Password reset", "Password reset please help") >= THRESHOLD
+    assert similarity("Billing question", "App crashes on start") < THRESHOLD
+
+
+def test_texts_without_shingles_only_match_each_other():
+    sigs = signatures(pd.Series(["", "the and", "Login issue"]))
+    assert (sigs[0] == sigs[1]).all()
+    assert not (sigs[0] == sigs[2]).all()
+
+
+def test_bands_split_the_signature():
+    sig = signatures(pd.Series(["Feature request"]))[0]
+    bands = _bands(sig)
+    assert [band for band, _ in bands] == list(range(BANDS))
+    assert b"".join(key for _, key in bands) == sig.tobytes()
+
+
+def test_match_finds_the_topic_through_lsh_buckets():
+    index = TopicIndex()
+    login, billing = signatures(pd.Series(["Login issue", "Billing question"]))
+    index._add_topic(1, "Login issue", login)
+    index._add_topic(2, "Billing question", billing)
+    variant, unrelated = signatures(pd.Series(["login issues", "Email not received"]))
+    assert index._match(variant) == 1
+    assert index._match(unrelated) is None
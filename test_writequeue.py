@@ -0,0 +1,139 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("streamlit")
+
+import writequeue
+from writequeue import WriteQueue, WriteQueueFull
+
+
+# Stands in for a pooled connection: the "cursor" is the list of values
+# written in the open transaction, and each commit records that list
+class FakeDatabase:
+    def __init__(self):
+        self.commits = []
+        self.rollbacks = 0
+
+    @contextmanager
+    def connection(self):
+        db = self
+        pending = []
+
+        class Connection:
+            def cursor(self):
+                return pending
+
+            def commit(self):
+                db.commits.append(list(pending))
+                pending.clear()
+
+            def rollback(self):
+                db.rollbacks += 1
+                pending.clear()
+
+        yield Connection()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(writequeue, "db_connection", database.connection)
+    return database
+
+
+# A write that holds the worker until released, so the writes submitted
+# meanwhile pile up in the queue
+class Blocker:
+    __name__ = "blocker"
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, cursor):
+        self.started.set()
+        self.release.wait(5)
+
+    def submit(self, queue):
+        queue.submit(self)
+        assert self.started.wait(5)
+
+
+def write(cursor, value):
+    if value == "bad":
+        raise ValueError("bad write")
+    cursor.append(value)
+    return value
+
+
+def test_queued_writes_are_committed_in_batches(database):
+    blocker = Blocker()
+    queue = WriteQueue(batch_size=10)
+    blocker.submit(queue)
+    handles = [queue.submit(write, value) for value in range(1, 6)]
+    blocker.release.set()
+    queue.flush()
+
+    assert [handle.wait(1) for handle in handles] == [1, 2, 3, 4, 5]
+    assert database.commits == [[], [1, 2, 3, 4, 5]]
+    assert queue.stats()["batches"] == 2
+    queue.shutdown()
+
+
+def test_batches_are_capped_at_batch_size(database):
+    blocker = Blocker()
+    queue = WriteQueue(batch_size=2)
+    blocker.submit(queue)
+    for value in range(5):
+        queue.submit(write, value)
+    blocker.release.set()
+    queue.flush()
+    assert database.commits[1:] == [[0, 1], [2, 3], [4]]
+    queue.shutdown()
+
+
+def test_failed_batch_is_retried_one_write_at_a_time(database):
+    blocker = Blocker()
+    committed = []
+    queue = WriteQueue(batch_size=10)
+    blocker.submit(queue)
+    good = queue.submit(write, "a", on_commit=lambda: committed.append("a"))
+    bad = queue.submit(write, "bad", on_commit=lambda: committed.append("bad"))
+    other = queue.submit(write, "b")
+    blocker.release.set()
+    queue.flush()
+
+    assert good.wait(1) == "a"
+    assert other.wait(1) == "b"
+    assert bad.status == "failed"
+    with pytest.raises(ValueError):
+        bad.wait(1)
+    assert database.rollbacks == 2
+    assert database.commits[1:] == [["a"], ["b"]]
+    assert committed == ["a"]
+    assert queue.stats()["failed"] == 1
+    queue.shutdown()
+
+
+def test_full_queue_rejects_after_timeout(database):
+    blocker = Blocker()
+    queue = WriteQueue(maxsize=1, batch_size=1, put_timeout=0.05)
+    blocker.submit(queue)
+    queue.submit(write, 1)
+    with pytest.raises(WriteQueueFull):
+        queue.submit(write, 2)
+    assert queue.stats()["rejected"] == 1
+    blocker.release.set()
+    queue.shutdown()
+
+
+def test_shutdown_flushes_pending_writes_and_refuses_new_ones(database):
+    queue = WriteQueue()
+    handles = [queue.submit(write, value) for value in range(3)]
+    queue.shutdown()
+    assert [handle.status for handle in handles] == ["committed"] * 3
+    with pytest.raises(WriteQueueFull):
+        queue.submit(write, 4)
@@ -0,0 +1,429 @@
+import os
+import re
+from datetime import datetime, timedelta
+
+from analytics import change_ticket_status, change_ticket_statuses, record_ticket_created
+from db import db_connection, note_write, read_connection
+from resultcache import invalidate
+from schema import ARCHIVE_TABLE
+from sla import record_first_responses
+from writequeue import get_write_queue, run_now
+
+# Data-access helpers used by login.py and the pages. They take and return
+# plain values and never touch Streamlit, so they can also be driven from
+# scripts such as bench.py. They expect the schema to be migrated already
+# (`python schema.py migrate`, a deploy step): the pages check it in
+# sections.begin_page(), scripts call ensure_schema() before borrowing a
+# connection.
+
+PAGE_SIZES = [25, 50, 100]
+
+# Columns shown in ticket lists; heavy text columns are fetched separately
+LIST_COLUMNS = """
+    t.ticket_id,
+    c.company_name,
+    c.phone,
+    t.subject,
+    t.priority,
+    t.status,
+    t.ticket_raised_on,
+    t.ticket_closed_on,
+    t.review_stars,
+    t.assigned_to,
+    t.comment_count
+"""
+
+# With CQMS_WRITE_BEHIND=1 the write helpers queue their work for the
+# background writer instead of committing on the caller's thread. Either
+# way they return a writequeue.WriteHandle.
+WRITE_BEHIND = os.environ.get("CQMS_WRITE_BEHIND") == "1"
+
+# InnoDB's default innodb_ft_min_token_size; shorter words are not indexed
+MIN_SEARCH_TERM = 3
+
+COMMENT_PAGE_SIZE = 20
+
+
+# Each read is split into a *_query builder returning (query, params,
+# finish), where finish turns the fetched rows into the result, and a thin
+# wrapper that runs it. dataservice.py runs the same builders on its async
+# pool, so the SQL lives in one place.
+
+def _one(rows):
+    return rows[0] if rows else None
+
+
+# One extra row is fetched to tell whether a next page exists
+def _page(page_size):
+    return lambda rows: (rows[:page_size], len(rows) > page_size)
+
+
+# Shared plumbing: querylog reports the helper calling these instead
+__querylog_skip__ = {"_read", "_write"}
+
+
+def _read(query, params, finish):
+    if query is None:
+        return finish([])
+    with read_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    return finish(rows)
+
+
+def login_user_query(email, password_hash, role):
+    return """
+        SELECT * FROM user_login
+        WHERE email = %s AND password_hash = %s AND role = %s AND status = 'active'
+    """, (email, password_hash, role), _one
+
+
+def get_login_user(email, password_hash, role):
+    return _read(*login_user_query(email, password_hash, role))
+
+
+def user_details_query(user_id):
+    return "SELECT * FROM customer_profile WHERE user_id = %s", (user_id,), _one
+
+
+#  Get user details
+def get_user_details(user_id):
+    return _read(*user_details_query(user_id))
+
+
+def user_name_query(user_id):
+    return "select name from user_login where user_id = %s", (user_id,), _one
+
+
+def get_user_name(user_id):
+    return _read(*user_name_query(user_id))
+
+
+# `changes` are the resultcache entities the write modifies; cached reads
+# of them are invalidated once it has committed. Every op returns a falsy
+# value when it changed no rows.
+def _write(op, *args, changes=("tickets",)):
+    on_commit = lambda: invalidate(*changes)
+    if WRITE_BEHIND:
+        # Marked up front: the commit happens on the writer thread, outside
+        # this session, and may not have happened by the next rerun
+        note_write()
+        return get_write_queue().submit(op, *args, on_commit=on_commit)
+    handle = run_now(op, *args, on_commit=on_commit)
+    if handle.result:
+        note_write()
+    return handle
+
+
+def _update_user_details(cursor, user_id, phone, address):
+    cursor.execute("""
+        UPDATE customer_profile
+        SET phone = %s, address = %s
+        WHERE user_id = %s
+    """, (phone, address, user_id))
+    return cursor.rowcount
+
+
+def _create_ticket(cursor, customer_id, heading, description, priority, raised_on):
+    cursor.execute("""
+        INSERT INTO support_ticket (customer_id,subject,description, priority, status, ticket_raised_on)
+        VALUES (%s, %s, %s, %s, 'open', %s)
+    """, (customer_id,heading, description, priority, raised_on))
+    record_ticket_created(cursor, raised_on, priority, "open")
+    return cursor.lastrowid
+
+
+#  Update user details
+def update_user_details(user_id, phone, address):
+    return _write(_update_user_details, user_id, phone, address, changes=(("user", user_id),))
+
+
+# The raise time is taken at submission, not when a queued write commits
+def create_ticket(customer_id, heading, description, priority):
+    return _write(_create_ticket, customer_id, heading, description, priority, datetime.now())
+
+
+# Filters for the ticket lists, all optional. Given as a dict or as a
+# tuple of (name, value) pairs, which is hashable for session caching:
+#   statuses, priorities     lists of values to include
+#   raised_from, raised_to   dates, inclusive
+#   customer_id              a single customer
+#   company                  company name prefix
+#   has_review               True / False
+#   min_stars                lowest review rating to include
+def ticket_filter_sql(filters, alias="t"):
+    filters = dict(filters or ())
+    where, params = [], []
+    for name, column in (("statuses", "status"), ("priorities", "priority")):
+        values = filters.get(name)
+        if values:
+            where.append(f"{alias}.{column} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+    if filters.get("raised_from"):
+        where.append(f"{alias}.ticket_raised_on >= %s")
+        params.append(filters["raised_from"])
+    if filters.get("raised_to"):
+        where.append(f"{alias}.ticket_raised_on < %s")
+        params.append(filters["raised_to"] + timedelta(days=1))
+    if filters.get("customer_id"):
+        where.append(f"{alias}.customer_id = %s")
+        params.append(filters["customer_id"])
+    if filters.get("company"):
+        prefix = re.sub(r"([%_\\])", r"\\\1", filters["company"].strip())
+        where.append(f"{alias}.customer_id IN "
+                     "(SELECT customer_id FROM customer_profile WHERE company_name LIKE %s)")
+        params.append(prefix + "%")
+    if filters.get("has_review") is not None:
+        where.append(f"{alias}.customer_review IS {'NOT ' if filters['has_review'] else ''}NULL")
+    if filters.get("min_stars"):
+        where.append(f"{alias}.review_stars >= %s")
+        params.append(filters["min_stars"])
+    return where, params
+
+
+# Sort options: label -> (column, direction). Lists are paged by keyset on
+# (column, ticket_id); see page_cursor().
+SORTS = {
+    "Newest first": ("ticket_raised_on", "DESC"),
+    "Oldest first": ("ticket_raised_on", "ASC"),
+    "Recently closed": ("ticket_closed_on", "DESC"),
+}
+DEFAULT_SORT = "Newest first"
+
+
+# WHERE conditions, params and ORDER BY for `sort`, continuing after the
+# cursor `after`; `qualified=False` leaves ORDER BY bare for UNION queries
+def _sort_sql(sort, after, alias="t", qualified=True):
+    column, direction = SORTS[sort]
+    where, params = [], []
+    if column == "ticket_closed_on":
+        where.append(f"{alias}.ticket_closed_on IS NOT NULL")
+    if after is not None:
+        op = "<" if direction == "DESC" else ">"
+        where.append(f"({alias}.{column} {op} %s OR ({alias}.{column} = %s AND {alias}.ticket_id {op} %s))")
+        params += [after[0], after[0], after[1]]
+    prefix = f"{alias}." if qualified else ""
+    return where, params, f"ORDER BY {prefix}{column} {direction}, {prefix}ticket_id {direction}"
+
+
+# Cursor for the page after `row` in a list sorted by `sort`
+def page_cursor(row, sort=DEFAULT_SORT):
+    return row[SORTS[sort][0]], row["ticket_id"]
+
+
+def user_tickets_query(user_id, include_archived=False, filters=None, sort=DEFAULT_SORT):
+    columns = "ticket_id, subject, priority, status, ticket_raised_on,ticket_closed_on, comment_count"
+    where, params = ticket_filter_sql(filters)
+    sort_where, _, order = _sort_sql(sort, None, qualified=False)
+    conditions = " ".join(f"AND {condition}" for condition in where + sort_where)
+    tables = ["support_ticket"]
+    if include_archived:
+        tables.append(ARCHIVE_TABLE)
+    query = " UNION ALL ".join(
+        f"SELECT {columns} FROM {table} t WHERE t.customer_id = %s {conditions}" for table in tables
+    )
+    return f"{query} {order}", tuple([user_id, *params] * len(tables)), list
+
+
+# A customer's tickets, newest first unless `sort` says otherwise, narrowed
+# by `filters` (see ticket_filter_sql); archived ones only on request
+def get_user_tickets(user_id, include_archived=False, filters=None, sort=DEFAULT_SORT):
+    return _read(*user_tickets_query(user_id, include_archived, filters, sort))
+
+
+# One page of tickets matching `filters`, ordered by `sort`. `after` is the
+# page_cursor() of the last row on the previous page, so the database
+# seeks straight to the next page instead of counting OFFSET rows.
+# Heavy text columns are left out; see get_ticket_details(). With
+# archived=True the pages come from the archive instead.
+def all_tickets_query(page_size=PAGE_SIZES[0], after=None, archived=False, filters=None, sort=DEFAULT_SORT):
+    where, params = ticket_filter_sql(filters)
+    sort_where, sort_params, order = _sort_sql(sort, after)
+    query = f"""
+        SELECT {LIST_COLUMNS}
+        FROM {ARCHIVE_TABLE if archived else "support_ticket"} t
+        JOIN customer_profile c ON t.customer_id = c.customer_id
+    """
+    if where + sort_where:
+        query += " WHERE " + " AND ".join(where + sort_where)
+    query += f" {order} LIMIT %s"
+    params = [*params, *sort_params, page_size + 1]
+    return query, tuple(params), _page(page_size)
+
+
+def get_all_tickets(page_size=PAGE_SIZES[0], after=None, archived=False, filters=None, sort=DEFAULT_SORT):
+    return _read(*all_tickets_query(page_size, after, archived, filters, sort))
+
+
+# Ranked full-text search over the ticket text (ft_ticket_text) and its
+# comments (ft_comment_body); a ticket's score is the sum of its matches.
+# Every word must match, as a prefix, within the ticket text or within one
+# comment, so "log fail" finds "Login failure". "#123" or "123" looks the
+# ticket up by ID instead.
+# Returns one page of list rows (best match first) and whether more exist.
+# `filters` narrow word searches the same way as the ticket lists.
+def search_query(text, page_size=PAGE_SIZES[0], page=0, filters=None):
+    text = text.strip()
+    ticket_id = re.fullmatch(r"#?(\d+)", text)
+    if ticket_id:
+        query = f"""
+            SELECT {LIST_COLUMNS}
+            FROM support_ticket t
+            JOIN customer_profile c ON t.customer_id = c.customer_id
+            WHERE t.ticket_id = %s
+        """
+        params = (int(ticket_id.group(1)),)
+    else:
+        terms = [term for term in re.findall(r"\w+", text) if len(term) >= MIN_SEARCH_TERM]
+        if not terms:
+            return None, (), _page(page_size)
+        boolean = " ".join(f"+{term}*" for term in terms)
+        where, filter_params = ticket_filter_sql(filters)
+        query = f"""
+            SELECT {LIST_COLUMNS}, m.score
+            FROM (
+                SELECT ticket_id, SUM(score) AS score
+                FROM (
+                    SELECT ticket_id, MATCH(subject, description) AGAINST (%s IN BOOLEAN MODE) AS score
+                    FROM support_ticket
+                    WHERE MATCH(subject, description) AGAINST (%s IN BOOLEAN MODE)
+                    UNION ALL
+                    SELECT ticket_id, MATCH(body) AGAINST (%s IN BOOLEAN MODE) AS score
+                    FROM ticket_comment
+                    WHERE MATCH(body) AGAINST (%s IN BOOLEAN MODE)
+                ) matches
+                GROUP BY ticket_id
+            ) m
+            JOIN support_ticket t ON t.ticket_id = m.ticket_id
+            JOIN customer_profile c ON t.customer_id = c.customer_id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY m.score DESC, t.ticket_id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = (boolean,) * 4 + (*filter_params, page_size + 1, page * page_size)
+    return query, params, _page(page_size)
+
+
+def search_tickets(text, page_size=PAGE_SIZES[0], page=0, filters=None):
+    return _read(*search_query(text, page_size, page, filters))
+
+
+def ticket_details_query(ticket_ids, table="support_ticket"):
+    placeholders = ", ".join(["%s"] * len(ticket_ids))
+    return f"""
+        SELECT ticket_id, description, customer_review, review_stars
+        FROM {table}
+        WHERE ticket_id IN ({placeholders})
+    """, tuple(ticket_ids), lambda rows: {row["ticket_id"]: row for row in rows}
+
+
+# Heavy per-ticket columns for the given tickets, in one query; tickets
+# not in the hot table are looked up in the archive
+def get_ticket_details(ticket_ids):
+    if not ticket_ids:
+        return {}
+    details = _read(*ticket_details_query(ticket_ids))
+    missing = [ticket_id for ticket_id in ticket_ids if ticket_id not in details]
+    if missing:
+        details.update(_read(*ticket_details_query(missing, ARCHIVE_TABLE)))
+    return details
+
+
+def ticket_comments_query(ticket_id, page_size=COMMENT_PAGE_SIZE, before=None):
+    query = """
+        SELECT tc.comment_id, tc.body, tc.created_at, u.name AS author
+        FROM ticket_comment tc
+        LEFT JOIN user_login u ON tc.author_id = u.user_id
+        WHERE tc.ticket_id = %s
+    """
+    params = [ticket_id]
+    if before is not None:
+        query += " AND (tc.created_at < %s OR (tc.created_at = %s AND tc.comment_id < %s))"
+        params += [before[0], before[0], before[1]]
+    query += " ORDER BY tc.created_at DESC, tc.comment_id DESC LIMIT %s"
+    params.append(page_size + 1)
+    return query, tuple(params), _page(page_size)
+
+
+# One page of a ticket's comments, newest first, and whether older ones
+# exist. `before` is the (created_at, comment_id) of the oldest comment
+# already shown.
+def get_ticket_comments(ticket_id, page_size=COMMENT_PAGE_SIZE, before=None):
+    return _read(*ticket_comments_query(ticket_id, page_size, before))
+
+
+# Append one comment per ticket; an agent comment counts as the first
+# response if none came before. Returns the number of tickets commented.
+def _add_comments(cursor, ticket_ids, body, author_id, created_at):
+    record_first_responses(cursor, ticket_ids, created_at.replace(microsecond=0))
+    cursor.executemany("""
+        INSERT INTO ticket_comment (ticket_id, author_id, body, created_at)
+        VALUES (%s, %s, %s, %s)
+    """, [(ticket_id, author_id, body, created_at) for ticket_id in ticket_ids])
+    placeholders = ", ".join(["%s"] * len(ticket_ids))
+    cursor.execute(
+        f"UPDATE support_ticket SET comment_count = comment_count + 1 WHERE ticket_id IN ({placeholders})",
+        tuple(ticket_ids)
+    )
+    return cursor.rowcount
+
+
+# `responded` is True when an agent, not the customer, changes the status;
+# with `from_status` the ticket only changes if it is still in that status
+def update_ticket_status(ticket_id, new_status, responded=False, from_status=None):
+    return _write(change_ticket_status, ticket_id, new_status, responded, from_status)
+
+
+# The comment time is taken at submission, not when a queued write commits
+def add_ticket_comment(ticket_id, comment, author_id=None):
+    return _write(_add_comments, [ticket_id], comment, author_id, datetime.now(),
+                  changes=("tickets", ("comments", ticket_id)))
+
+
+# Bulk actions: one statement and one commit however many tickets are picked
+def bulk_update_status(ticket_ids, new_status, responded=False):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        changed = change_ticket_statuses(cursor, ticket_ids, new_status, responded)
+        conn.commit()
+    if changed:
+        note_write()
+        invalidate("tickets")
+    return changed
+
+
+def bulk_add_comment(ticket_ids, comment, author_id=None):
+    if not comment.strip():
+        raise ValueError("comment is empty")
+    ticket_ids = list(dict.fromkeys(ticket_ids))
+    if not ticket_ids:
+        return 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        changed = _add_comments(cursor, ticket_ids, comment, author_id, datetime.now())
+        conn.commit()
+    if changed:
+        note_write()
+        invalidate("tickets", *[("comments", ticket_id) for ticket_id in ticket_ids])
+    return changed
+
+
+# Reviews may arrive after a closed ticket has been archived
+def save_review(ticket_id, review_text, review_stars):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for table in ("support_ticket", ARCHIVE_TABLE):
+            cursor.execute(f"""
+                UPDATE {table}
+                SET customer_review = %s, review_stars = %s
+                WHERE ticket_id = %s
+            """, (review_text, review_stars, ticket_id))
+            changed = cursor.rowcount
+            if changed:
+                break
+        conn.commit()
+    if changed:
+        note_write()
+        invalidate("tickets")
+    return changed
@@ -0,0 +1,285 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import db_connection
+from schema import ensure_schema
+
+# Topic index behind "Most Common Query Topics". Ticket subjects (or the
+# description, when the subject is blank) are normalised and shingled with
+# vectorised pandas string operations, MinHash-signed with numpy, and
+# matched against existing topics through LSH banding, so "Login issue"
+# and "login issues!" land in the same topic. Each ticket is assigned
+# once, when first seen; the assignment and per-topic counts live in
+# ticket_topic / ticket_topic_assignment, and top-K is served from the
+# in-memory counts without rescanning support_ticket.
+#
+# Unindexed tickets are found with an anti-join against the assignments,
+# not a MAX(ticket_id) watermark, since ticket ids do not commit in order.
+# A refresh only looks OVERLAP ids behind the newest assigned ticket;
+# every FULL_SCAN_AFTER seconds it checks the whole table, for anything
+# a long transaction committed further back.
+#
+# Only one process indexes at a time (MySQL GET_LOCK); the others pick up
+# its topics and counts on their next refresh.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+# Estimated Jaccard similarity needed to join an existing topic
+THRESHOLD = 0.5
+CHUNK_SIZE = 1000
+OVERLAP = 1000
+FULL_SCAN_AFTER = 3600
+LOCK_NAME = "cqms_topic_index"
+
+UNINDEXED_SQL = """
+    SELECT t.ticket_id, t.subject, t.description
+    FROM support_ticket t
+    LEFT JOIN ticket_topic_assignment a ON a.ticket_id = t.ticket_id
+    WHERE t.ticket_id > %s AND a.ticket_id IS NULL
+    ORDER BY t.ticket_id
+    LIMIT %s
+"""
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "cannot", "for", "from",
+    "i", "in", "is", "it", "my", "not", "of", "on", "or", "please", "the", "to",
+    "unable", "was", "we", "with",
+}
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+
+
+# Lowercase, strip punctuation and plural "s"; one string of words per text
+def normalize(texts):
+    return (texts.fillna("").str.lower()
+            .str.replace(r"[^a-z0-9]+", " ", regex=True)
+            .str.replace(r"(?<=\w\w[a-rt-z0-9])s\b", "", regex=True)
+            .str.strip())
+
+
+# Word and character-trigram shingles, as a Series indexed by row position
+def shingles(texts):
+    words = normalize(texts).str.split().explode().dropna()
+    words = words[~words.isin(STOPWORDS)]
+    if words.empty:
+        return words
+    padded = " " + words + " "
+    trigrams = pd.concat([padded.str.slice(i, i + 3) for i in range(padded.str.len().max() - 2)])
+    trigrams = trigrams[trigrams.str.len() == 3]
+    return pd.concat(["w:" + words, "c:" + trigrams])
+
+
+# MinHash signature per text: an (n, NUM_PERM) uint64 array. Texts without
+# any shingle get all-max signatures and therefore match each other only.
+def signatures(texts):
+    texts = texts.reset_index(drop=True)
+    sigs = np.full((len(texts), NUM_PERM), _PRIME, dtype=np.uint64)
+    found = shingles(texts)
+    if found.empty:
+        return sigs
+    found = found.sort_index(kind="stable")
+    hashes = pd.util.hash_pandas_object(found, index=False).to_numpy() & np.uint64(_PRIME)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % np.uint64(_PRIME)
+    rows = found.index.to_numpy()
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    sigs[rows[starts]] = np.minimum.reduceat(permuted, starts, axis=0)
+    return sigs
+
+
+def _bands(sig):
+    return [(band, sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            for band in range(BANDS)]
+
+
+class TopicIndex:
+    def __init__(self, threshold=THRESHOLD, chunk_size=CHUNK_SIZE,
+                 overlap=OVERLAP, full_scan_after=FULL_SCAN_AFTER):
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.full_scan_after = full_scan_after
+        self._lock = threading.Lock()
+        self._reset()
+        self.indexed = 0
+
+    def _reset(self):
+        self._labels = {}
+        self._counts = {}
+        self._sigs = {}
+        self._buckets = {}
+        self._max_topic = 0
+        self._synced = None
+        self._scanned_at = None
+
+    def _add_topic(self, topic_id, label, sig, count=0):
+        self._labels[topic_id] = label
+        self._counts[topic_id] = count
+        self._sigs[topic_id] = sig
+        for key in _bands(sig):
+            self._buckets.setdefault(key, []).append(topic_id)
+        self._max_topic = max(self._max_topic, topic_id)
+
+    # Best matching topic for a signature, or None below the threshold
+    def _match(self, sig):
+        candidates = {t for key in _bands(sig) for t in self._buckets.get(key, ())}
+        best, best_score = None, self.threshold
+        for topic_id in candidates:
+            score = np.count_nonzero(self._sigs[topic_id] == sig) / NUM_PERM
+            if score >= best_score:
+                best, best_score = topic_id, score
+        return best
+
+    # Pick up topics and counts written by any process
+    def _sync(self, cursor):
+        cursor.execute("""
+            SELECT topic_id, label, signature FROM ticket_topic
+            WHERE topic_id > %s ORDER BY topic_id
+        """, (self._max_topic,))
+        for topic_id, label, signature in cursor.fetchall():
+            self._add_topic(topic_id, label, np.frombuffer(signature, dtype=np.uint64).copy())
+        cursor.execute("SELECT topic_id, ticket_count FROM ticket_topic")
+        self._counts.update({topic_id: int(count) for topic_id, count in cursor.fetchall()})
+
+    # Changes whenever any process adds a topic or an assignment; counts
+    # only grow
+    def _topic_state(self, cursor):
+        cursor.execute("SELECT COALESCE(MAX(topic_id), 0), COALESCE(SUM(ticket_count), 0) FROM ticket_topic")
+        return tuple(int(value) for value in cursor.fetchone())
+
+    def _full_scan_due(self):
+        return (self._scanned_at is None
+                or time.monotonic() - self._scanned_at > self.full_scan_after)
+
+    # Newest assigned ticket less the overlap, or 0 for a full scan
+    def _scan_floor(self, cursor, full_scan):
+        if full_scan:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(ticket_id), 0) FROM ticket_topic_assignment")
+        return max(cursor.fetchone()[0] - self.overlap, 0)
+
+    def _unindexed(self, cursor, after, limit):
+        cursor.execute(UNINDEXED_SQL, (after, limit))
+        return cursor.fetchall()
+
+    # Assign one chunk of unindexed tickets; returns how many there were
+    # and the last ticket id
+    def _index_chunk(self, conn, cursor, after):
+        rows = self._unindexed(cursor, after, self.chunk_size)
+        if not rows:
+            return 0, after
+        chunk = pd.DataFrame(rows, columns=["ticket_id", "subject", "description"])
+        subject = chunk["subject"].fillna("").str.strip()
+        text = subject.where(subject != "", chunk["description"].fillna("").str.slice(0, 200))
+        sigs = signatures(text)
+
+        assignments, added = [], {}
+        for position, ticket_id in enumerate(chunk["ticket_id"]):
+            sig = sigs[position]
+            topic_id = self._match(sig)
+            if topic_id is None:
+                label = (text.iloc[position].strip() or "(no subject)")[:255]
+                cursor.execute(
+                    "INSERT INTO ticket_topic (label, signature, ticket_count) VALUES (%s, %s, 0)",
+                    (label, sig.tobytes())
+                )
+                topic_id = cursor.lastrowid
+                self._add_topic(topic_id, label, sig)
+            assignments.append((int(ticket_id), topic_id))
+            added[topic_id] = added.get(topic_id, 0) + 1
+
+        cursor.executemany(
+            "INSERT INTO ticket_topic_assignment (ticket_id, topic_id) VALUES (%s, %s)", assignments
+        )
+        cursor.executemany(
+            "UPDATE ticket_topic SET ticket_count = ticket_count + %s WHERE topic_id = %s",
+            [(n, topic_id) for topic_id, n in added.items()]
+        )
+        conn.commit()
+        for topic_id, n in added.items():
+            self._counts[topic_id] += n
+        return len(rows), assignments[-1][0]
+
+    def _refresh(self):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            state = self._topic_state(cursor)
+            if state != self._synced:
+                self._sync(cursor)
+                self._synced = state
+            full_scan = self._full_scan_due()
+            floor = self._scan_floor(cursor, full_scan)
+            if not self._unindexed(cursor, floor, 1):
+                if full_scan:
+                    self._scanned_at = time.monotonic()
+                return
+
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            if not cursor.fetchone()[0]:
+                return
+            try:
+                # Another process may have indexed between our reads; end
+                # the snapshot they were made in so the re-check sees it
+                conn.commit()
+                state = self._topic_state(cursor)
+                if state != self._synced:
+                    self._sync(cursor)
+                after = floor
+                while True:
+                    count, after = self._index_chunk(conn, cursor, after)
+                    if not count:
+                        break
+                    self.indexed += count
+                self._synced = self._topic_state(cursor)
+                if full_scan:
+                    self._scanned_at = time.monotonic()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchone()
+
+    # Assign tickets added since the last refresh; cheap when none were
+    def refresh(self):
+        ensure_schema()
+        with self._lock:
+            try:
+                self._refresh()
+            except Exception:
+                # Topics created in a rolled-back chunk may be in memory;
+                # start over from what the database holds
+                self._reset()
+                raise
+
+    # The `limit` largest topics as a Series of ticket counts by label
+    def top_topics(self, limit=5):
+        with self._lock:
+            top = sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return pd.Series({self._labels[t]: n for t, n in top if n > 0}, name="Count", dtype=int)
+
+    def stats(self):
+        with self._lock:
+            return {"topics": len(self._labels), "indexed": self.indexed}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_topic_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TopicIndex()
+    return _index
+
+
+def get_top_topics(limit=5):
+    index = get_topic_index()
+    index.refresh()
+    return index.top_topics(limit)
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db import db_connection, note_write, read_connection
+from resultcache import invalidate
+from schema import ensure_schema
+from tickets import LIST_COLUMNS
+
+# "Next ticket" mode for agents. Instead of everyone picking from the same
+# list, an agent claims the highest-priority, oldest open ticket nobody
+# holds. The claim reads with FOR UPDATE SKIP LOCKED, so agents claiming at
+# the same moment each lock a different row instead of queueing behind one
+# another. A claim on a ticket still open after CLAIM_TIMEOUT_MINUTES is
+# released back to the queue; moving the ticket on (In Progress, Closed)
+# keeps it with its assignee.
+
+CLAIM_TIMEOUT_MINUTES = int(os.environ.get("CQMS_CLAIM_TIMEOUT_MINUTES", "30"))
+# Expired claims are released at most this often per process
+RELEASE_INTERVAL = 30
+CLAIM_ORDER = ["High", "Medium", "Low"]
+
+# First unclaimed open ticket of one priority, locked for the claim
+CLAIM_SQL = """
+    SELECT ticket_id FROM support_ticket
+    WHERE status = 'Open' AND priority = %s AND assigned_to IS NULL
+    ORDER BY ticket_raised_on, ticket_id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+"""
+
+CLAIMED_SQL = f"""
+    SELECT {LIST_COLUMNS}, t.claimed_at
+    FROM support_ticket t
+    JOIN customer_profile c ON t.customer_id = c.customer_id
+    WHERE t.assigned_to = %s AND t.status <> 'Closed'
+    ORDER BY t.claimed_at, t.ticket_id
+"""
+
+QUEUE_DEPTH_SQL = """
+    SELECT priority, COUNT(*) FROM support_ticket
+    WHERE status = 'Open' AND assigned_to IS NULL
+    GROUP BY priority
+"""
+
+_last_release = 0.0
+_release_lock = threading.Lock()
+
+
+# Return claims older than the timeout on tickets nobody started; returns
+# how many were released
+def release_expired_claims(force=False):
+    global _last_release
+    with _release_lock:
+        now = time.monotonic()
+        if not force and now - _last_release < RELEASE_INTERVAL:
+            return 0
+        _last_release = now
+    ensure_schema()
+    cutoff = datetime.now() - timedelta(minutes=CLAIM_TIMEOUT_MINUTES)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE support_ticket SET assigned_to = NULL, claimed_at = NULL
+            WHERE claimed_at < %s AND status = 'Open'
+        """, (cutoff,))
+        released = cursor.rowcount
+        conn.commit()
+    if released:
+        note_write()
+        invalidate("tickets")
+    return released
+
+
+# Claim the next ticket for `agent_id`; returns its id, or None when the
+# queue is empty. One index range per priority, so the first row of the
+# first non-empty priority is the one taken.
+def claim_next_ticket(agent_id):
+    release_expired_claims()
+    now = datetime.now().replace(microsecond=0)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for priority in CLAIM_ORDER:
+            cursor.execute(CLAIM_SQL, (priority,))
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.execute("""
+                    UPDATE support_ticket SET assigned_to = %s, claimed_at = %s
+                    WHERE ticket_id = %s
+                """, (agent_id, now, row[0]))
+                conn.commit()
+                note_write()
+                invalidate("tickets")
+                return row[0]
+        conn.commit()
+    return None
+
+
+# Hand a claimed ticket back to the queue; only its assignee can
+def release_ticket(ticket_id, agent_id):
+    ensure_schema()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE support_ticket SET assigned_to = NULL, claimed_at = NULL
+            WHERE ticket_id = %s AND assigned_to = %s AND status <> 'Closed'
+        """, (ticket_id, agent_id))
+        released = cursor.rowcount > 0
+        conn.commit()
+    if released:
+        note_write()
+        invalidate("tickets")
+    return released
+
+
+# The agent's unfinished tickets as list rows, oldest claim first
+def get_claimed_tickets(agent_id):
+    ensure_schema()
+    with read_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(CLAIMED_SQL, (agent_id,))
+        return cursor.fetchall()
+
+
+# Unclaimed open tickets per priority, in claim order
+def queue_depth():
+    ensure_schema()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(QUEUE_DEPTH_SQL)
+        counts = {priority: int(count) for priority, count in cursor.fetchall()}
+    return {priority: counts.get(priority, 0) for priority in CLAIM_ORDER}
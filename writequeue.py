@@ -0,0 +1,179 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from db import db_connection
+
+# Optional write-behind for the ticket write helpers (CQMS_WRITE_BEHIND=1).
+# Writes are queued in a bounded in-process queue and a single worker
+# thread commits them in batches, one transaction per batch. Each write
+# returns a WriteHandle that completes only once its transaction has
+# committed, so callers can wait on it or poll it. A full queue blocks the
+# caller for up to `put_timeout` seconds before raising WriteQueueFull,
+# and pending writes are flushed at interpreter exit. An optional on_commit
+# callback runs right after a write's commit, before its handle completes.
+
+QUEUE_SIZE = int(os.environ.get("CQMS_WRITE_QUEUE_SIZE", "1000"))
+BATCH_SIZE = int(os.environ.get("CQMS_WRITE_BATCH_SIZE", "50"))
+PUT_TIMEOUT = float(os.environ.get("CQMS_WRITE_QUEUE_TIMEOUT", "2"))
+SHUTDOWN_TIMEOUT = 30
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class WriteHandle:
+    def __init__(self, name, on_commit=None):
+        self.name = name
+        self.on_commit = on_commit
+        self.submitted = time.time()
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def _finish(self, result=None, error=None):
+        if error is None and self.on_commit is not None:
+            self.on_commit()
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def status(self):
+        if not self.done():
+            return "pending"
+        return "failed" if self.error is not None else "committed"
+
+    # Block until committed (returns the result) or failed (raises)
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} not committed after {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Run op(cursor, *args) now, in its own transaction, and return an already
+# completed handle; the synchronous counterpart of WriteQueue.submit
+def run_now(op, *args, on_commit=None):
+    handle = WriteHandle(op.__name__, on_commit)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        result = op(cursor, *args)
+        conn.commit()
+    handle._finish(result)
+    return handle
+
+
+class WriteQueue:
+    def __init__(self, maxsize=QUEUE_SIZE, batch_size=BATCH_SIZE, put_timeout=PUT_TIMEOUT):
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "committed": 0, "failed": 0, "batches": 0, "rejected": 0}
+        self._worker = threading.Thread(target=self._run, name="cqms-write-queue", daemon=True)
+        self._worker.start()
+
+    def submit(self, op, *args, on_commit=None):
+        if self._closed:
+            raise WriteQueueFull("write queue is shut down")
+        handle = WriteHandle(op.__name__, on_commit)
+        try:
+            self._queue.put((op, args, handle), timeout=self.put_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise WriteQueueFull(f"write queue full ({self._queue.maxsize} pending)")
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        return handle
+
+    # Up to batch_size queued writes, and whether the stop marker was seen
+    def _take_batch(self):
+        batch = []
+        item = self._queue.get()
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        self._queue.task_done()
+        return batch, True
+
+    def _commit(self, batch):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                results = [op(cursor, *args) for op, args, _ in batch]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return results
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._take_batch()
+            if not batch:
+                continue
+            try:
+                results = self._commit(batch)
+                outcomes = [(handle, result, None) for (_, _, handle), result in zip(batch, results)]
+            except Exception:
+                # One bad write must not sink the rest: retry one by one
+                outcomes = []
+                for item in batch:
+                    try:
+                        outcomes.append((item[2], self._commit([item])[0], None))
+                    except Exception as e:
+                        outcomes.append((item[2], None, e))
+            for handle, result, error in outcomes:
+                handle._finish(result, error)
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["committed"] += sum(1 for _, _, e in outcomes if e is None)
+                self._stats["failed"] += sum(1 for _, _, e in outcomes if e is not None)
+            for _ in batch:
+                self._queue.task_done()
+
+    # Block until everything queued so far has been committed or failed
+    def flush(self):
+        self._queue.join()
+
+    # Stop accepting writes, drain what is queued and stop the worker
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    global _write_queue
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = WriteQueue()
+                atexit.register(_write_queue.shutdown)
+    return _write_queue